@@ -0,0 +1 @@
+"""Benchmarks for the dashboard computations, run on synthetic events."""
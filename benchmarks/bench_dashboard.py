@@ -0,0 +1,145 @@
+"""Headless timings of the Dashboard's computations on synthetic events.
+
+    python -m benchmarks.bench_dashboard --rows 10m --output bench-results.jsonl
+    python -m benchmarks.bench_dashboard --compare bench-results.jsonl
+
+Writes (or reuses) a synthetic events CSV of the requested size, then times
+what a Dashboard session computes: building the rollup cube from the CSV,
+reopening it from its cache, walking the category cascade, top-k rankings,
+treemap aggregation, the time series, the raw-event drill-down and the
+conversion funnels.  Each stage reports its throughput in source events per
+second and the process's peak RSS so far.  Runs are appended to ``--output``
+tagged with the commit and size, so results can be compared across commits.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic import SIZES, parse_size
+from techtrackr import instrument
+from techtrackr.analytics import Analytics
+from techtrackr.figures import collapse_tail
+from techtrackr.memo import LRUMemo
+from techtrackr.rollup import RollupCube
+from techtrackr.shared import SharedEvents
+from techtrackr.timeseries import EVENT_TYPES
+
+
+def commit():
+    """Short hash of the checked out commit, marked when the tree has changes."""
+    try:
+        head = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head + ('-dirty' if dirty else '')
+
+
+def events_csv(rows, seed, data_dir):
+    """Path of the synthetic export, written on first use in a child process
+    so generating it does not count towards this process's peak RSS."""
+    path = os.path.join(data_dir, f'events-{rows}-{seed}.csv')
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Writing {rows:,} events to {path}...")
+        subprocess.run([sys.executable, '-m', 'benchmarks.synthetic', path + '.tmp', '--rows', str(rows), '--seed', str(seed)], check=True)
+        os.replace(path + '.tmp', path)
+    return path
+
+
+def run(path, cache_dir, profile):
+    with profile.stage('build'):
+        RollupCube(path, cache_dir=cache_dir).refresh()
+
+    with profile.stage('reopen'):
+        cube = RollupCube(path, cache_dir=cache_dir).refresh()
+    events = int(cube.table['count'].sum())
+    # Memoized as in the Dashboard, so queries sharing an intermediate result
+    # (e.g. daily and hourly counts) compute it once
+    core = Analytics(cube, events=lambda: SharedEvents.open(path, cache_dir), memo=LRUMemo())
+
+    with profile.stage('cascade') as record:
+        # Every selection the sidebar cascade allows
+        paths = core.category_paths()
+        for selection in paths:
+            core.event_totals(*selection)
+        record['rows'] = len(paths)
+
+    # The heavier queries run for the empty selection and every top level
+    selections = paths[:1] + [selection for selection in paths if len(selection) == 1]
+    with profile.stage('top_k'):
+        for selection in selections:
+            rankings = core.rankings(*selection)
+            for event_type in EVENT_TYPES:
+                rankings.top('brand', event_type)
+                rankings.top('category', event_type)
+
+    with profile.stage('treemap'):
+        for selection in selections:
+            collapse_tail(core.brand_preferences(*selection), ['subcategory', 'brand'], 'count')
+
+    with profile.stage('time_series'):
+        for selection in selections:
+            core.daily_counts(*selection)
+            core.hourly_counts(*selection)
+
+    with profile.stage('drill_down'):
+        core.top_products(event_type='purchase')
+
+    with profile.stage('funnel'):
+        # Built from the raw events once, then grouped per selection
+        for selection in selections:
+            core.funnel(*selection)
+            core.funnel(*selection, by='brand')
+    return events
+
+
+def report(profile, events):
+    print(f"{'stage':<12} {'seconds':>9} {'events/s':>14} {'peak RSS':>10}")
+    for stage in profile.stages:
+        rate = events / stage['seconds'] if stage['seconds'] else float('inf')
+        peak = stage['peak_bytes'] / 2**20 if stage['peak_bytes'] is not None else float('nan')
+        print(f"{stage['stage']:<12} {stage['seconds']:9.3f} {rate:14,.0f} {peak:8,.0f}MB")
+
+
+def compare(path, rows=None):
+    """Median seconds per stage for every logged commit, oldest first."""
+    log = instrument.read_log(path)
+    log = log[(log['run'] == 'bench_dashboard') & (log['stage'] != '')]
+    log = log.assign(commit=log['commit'].fillna('unknown'))
+    if rows is not None:
+        log = log[log['rows_total'] == rows]
+    table = log.pivot_table(index=['rows_total', 'commit'], columns='stage', values='seconds', aggfunc='median', sort=False)
+    return table[[stage for stage in log['stage'].unique()]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=parse_size, default='1m', help="rows, or one of: " + ', '.join(SIZES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--data-dir', default='.bench-data', help="where generated events are kept between runs")
+    parser.add_argument('--output', default='bench-results.jsonl', help="JSON-lines log to append results to ('' for none)")
+    parser.add_argument('--compare', metavar='LOG', help="print results logged in LOG by commit instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare(args.compare).to_string(float_format='{:.3f}'.format))
+        return
+
+    path = events_csv(args.rows, args.seed, args.data_dir)
+    tags = {'commit': commit(), 'rows_total': args.rows, 'seed': args.seed, 'cpus': os.cpu_count()}
+    print(f"{args.rows:,} events, {os.path.getsize(path) / 2**20:,.0f} MB, commit {tags['commit']}")
+    for _ in range(args.repeat):
+        # A fresh cache directory per run so every build starts from scratch
+        with tempfile.TemporaryDirectory() as cache_dir:
+            profile = instrument.Profile('bench_dashboard', log_path=args.output, tags=tags)
+            events = run(path, cache_dir, profile)
+            profile.finish()
+        report(profile, events)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Rollup cube build time across worker counts.
+
+    python -m benchmarks.bench_parallel --rows 5000000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import generate_events, write_events_csv
+from techtrackr.parallel import get_backend
+from techtrackr.rollup import RollupCube
+
+
+def build_time(path, cache_dir, workers):
+    cube = RollupCube(path, cache_dir=cache_dir, backend=get_backend(workers))
+    start = time.perf_counter()
+    cube.refresh()
+    return time.perf_counter() - start, cube
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'events.csv')
+        print(f"Writing {args.rows:,} events...")
+        write_events_csv(generate_events(args.rows), path)
+        size = os.path.getsize(path)
+        print(f"{size / 2**20:,.0f} MB, {os.cpu_count()} CPUs")
+
+        baseline = None
+        for workers in sorted(set(args.workers)):
+            # A fresh cache directory per run so every build starts from scratch
+            seconds, cube = build_time(path, os.path.join(directory, f'cache-{workers}'), workers)
+            baseline = baseline or seconds
+            print(f"{workers:3d} workers: {seconds:8.2f}s  {size / 2**20 / seconds:8.1f} MB/s  "
+                  f"speedup {baseline / seconds:4.1f}x  ({cube.table['count'].sum():,} events)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Memory held per dashboard session: copied frames vs. shared, mapped events.
+
+    python -m benchmarks.bench_sessions --rows 5000000 --sessions 1 10 50
+"""
+import argparse
+import os
+import pickle
+import tempfile
+
+from benchmarks.synthetic import generate_events
+from techtrackr.shared import SharedEvents, write_shared
+
+
+def frame_bytes(*frames):
+    return sum(int(frame.memory_usage(deep=True).sum()) for frame in frames)
+
+
+def copied_session(data, category):
+    """What one rerun used to hold: the st.cache_data copy plus filtered copies."""
+    data = pickle.loads(pickle.dumps(data))
+    data = data.dropna(subset=['category_code'])
+    filtered = data[data['category_code'].str.startswith(category)]
+    purchase = filtered[filtered['event_type'] == 'purchase']
+    view = filtered[filtered['event_type'] == 'view']
+    cart = filtered[filtered['event_type'] == 'cart']
+    return frame_bytes(data, filtered, purchase, view, cart)
+
+
+def shared_session(events, category):
+    """A rerun against SharedEvents: row-index arrays plus one gathered drill-down."""
+    rows = events.rows(category)
+    purchase = events.rows(category, event_type='purchase')
+    drill_down = events.frame(['product_id', 'brand', 'price'], purchase)
+    return rows.nbytes + purchase.nbytes + frame_bytes(drill_down)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--category', default='electronics')
+    args = parser.parse_args()
+
+    data = generate_events(args.rows)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'events.arrow')
+        categories_path = os.path.join(directory, 'events.categories.arrow')
+        events = SharedEvents(path, categories_path, write_shared(data, path, categories_path))
+
+        copied = copied_session(data, args.category)
+        shared = shared_session(events, args.category)
+        # Not per session: the mapping lives in the page cache, shared by all
+        # processes, and the category index is built once per process
+        mapped, index = events.nbytes, events.category_index.nbytes
+
+        mb = 2 ** 20
+        print(f"{args.rows:,} events; in-memory frame {frame_bytes(data) / mb:,.0f} MB")
+        print(f"per session: copied frames {copied / mb:,.1f} MB, shared views {shared / mb:,.1f} MB")
+        print(f"shared: {mapped / mb:,.0f} MB mapped once per host, {index / mb:,.0f} MB category index per process")
+        for sessions in args.sessions:
+            print(f"{sessions:4d} concurrent sessions: copied {sessions * copied / mb:10,.0f} MB   "
+                  f"shared {(mapped + index + sessions * shared) / mb:10,.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Fused time-series groupby vs. the original six filter-and-groupby scans.
+
+    python -m benchmarks.bench_timeseries --rows 10000000
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import generate_events
+from techtrackr.rollup import aggregate
+from techtrackr.timeseries import daily_counts, event_time_series, hourly_counts
+
+
+def six_scans(data):
+    """The Dashboard's original approach: one filter + groupby per chart series."""
+    def counts(event_type, by):
+        return data[data['event_type'] == event_type].groupby([by]).size().reset_index(name='count')
+
+    daily_view = counts('view', 'event_date')
+    hourly_view = counts('view', 'event_hour')
+    daily_cart_purchase = counts('cart', 'event_date').merge(
+        counts('purchase', 'event_date'), on='event_date', suffixes=('_cart', '_purchase'))
+    hourly_cart_purchase = counts('cart', 'event_hour').merge(
+        counts('purchase', 'event_hour'), on='event_hour', suffixes=('_cart', '_purchase'))
+    return daily_view, hourly_view, daily_cart_purchase, hourly_cart_purchase
+
+
+def fused(data):
+    wide = event_time_series(data)
+    return daily_counts(wide), hourly_counts(wide)
+
+
+def from_cube(table):
+    wide = event_time_series(table, weights='count')
+    return daily_counts(wide), hourly_counts(wide)
+
+
+def best_of(function, argument, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows:,} events...")
+    data = generate_events(args.rows)
+    table = aggregate(data)
+
+    baseline = best_of(six_scans, data, args.repeat)
+    single_pass = best_of(fused, data, args.repeat)
+    cube = best_of(from_cube, table, args.repeat)
+
+    print(f"six scans:          {baseline:8.3f}s")
+    print(f"fused groupby:      {single_pass:8.3f}s  ({baseline / single_pass:.1f}x)")
+    print(f"fused on the cube:  {cube:8.3f}s  ({baseline / cube:.0f}x, {len(table):,} cube rows)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Synthetic events shaped like the eCommerce behavior export.
+
+Frames are generated directly with the dtypes produced by
+``techtrackr.ingest.load_events``, so benchmarks can skip the CSV parse.
+Events come from browsing sessions over a fixed product catalogue:
+product popularity, categories and brands are Zipf-skewed, a fraction of
+products has no category or brand (as in the real export), traffic peaks in
+the evening, carts follow a view of the same product in the same session,
+and purchases follow a cart of it.  :func:`iter_events` generates large datasets chunk by
+chunk, so 100M rows can be written without holding them in memory::
+
+    python -m benchmarks.synthetic events.csv --rows 10m
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute
+import pyarrow.csv
+
+from techtrackr.ingest import time_features
+
+
+# Dataset sizes the benchmarks are usually run at
+SIZES = {'1m': 1_000_000, '10m': 10_000_000, '100m': 100_000_000}
+
+EVENT_TYPES = ['view', 'cart', 'purchase']
+EVENT_TYPE_WEIGHTS = [0.92, 0.06, 0.02]
+
+CATEGORIES = [
+    'electronics.smartphone', 'electronics.audio.headphone', 'electronics.video.tv',
+    'electronics.clocks', 'computers.notebook', 'computers.desktop',
+    'computers.peripherals.printer', 'appliances.kitchen.refrigerators',
+    'appliances.kitchen.washer', 'appliances.environment.vacuum',
+    'appliances.personal.massager', 'furniture.bedroom.bed', 'furniture.living_room.sofa',
+    'apparel.shoes', 'apparel.shoes.keds', 'auto.accessories.player', 'kids.toys',
+    'construction.tools.drill', 'sport.bicycle', 'stationery.cartrige', 'jewelry',
+]
+
+BRANDS = ['samsung', 'apple', 'xiaomi', 'huawei', 'lucente', 'lg', 'bosch', 'oppo',
+          'sony', 'respect', 'acer', 'lenovo', 'artel', 'hp', 'indesit', 'asus',
+          'elenberg', 'cordiant', 'redmond', 'philips', 'vitek', 'polaris']
+
+# First category_id of the export; synthetic ids count up from it
+CATEGORY_ID_BASE = 2053013552226107603
+
+# Average events per browsing session and seconds between its events
+SESSION_EVENTS = 5
+SESSION_GAP = 60
+
+CSV_COLUMNS = ['event_time', 'event_type', 'product_id', 'category_id', 'category_code',
+               'brand', 'price', 'user_id', 'user_session']
+
+
+def _zipf_weights(count, exponent=1.1):
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def brand_names(count):
+    """``count`` brand names: the real ones, then a long tail of made-up ones."""
+    return BRANDS[:count] + [f'brand{number:05d}' for number in range(len(BRANDS), count)]
+
+
+def product_catalogue(products=50_000, brands=500, seed=0):
+    """Products with their category and brand codes (-1 for none) and price."""
+    rng = np.random.default_rng([seed, 1])
+    category = rng.choice(len(CATEGORIES), products, p=_zipf_weights(len(CATEGORIES)))
+    brand = rng.choice(brands, products, p=_zipf_weights(brands))
+    return pd.DataFrame({
+        'product_id': rng.choice(np.arange(1_000_000, 60_000_000), products, replace=False).astype('int32'),
+        'category': np.where(rng.random(products) < 0.3, -1, category),
+        'brand': np.where(rng.random(products) < 0.15, -1, brand),
+        'price': rng.lognormal(4.5, 1.0, products).round(2).astype('float32'),
+    })
+
+
+def _session_events(rng, rows, sessions, start, seconds):
+    """Session number and event time (epoch seconds) of ``rows`` events."""
+    # Sessions start in the hours from ``start`` to ``start + seconds``,
+    # weighted by the time of day so traffic peaks in the evening
+    hour_weights = 1.2 + np.sin((np.arange(24) - 9) / 24 * 2 * np.pi)
+    hours = start // 3600 + np.arange(max(seconds // 3600, 1))
+    weights = hour_weights[hours % 24]
+    hour = rng.choice(hours, sessions, p=weights / weights.sum())
+    session_start = hour * 3600 + rng.integers(0, 3600, sessions)
+
+    session = np.sort(rng.integers(0, sessions, rows))
+    first = np.r_[True, session[1:] != session[:-1]]
+    gaps = rng.exponential(SESSION_GAP, rows).astype('int64')
+    gaps[first] = 0
+    # Offset of every event from its session's start: gaps summed per session
+    elapsed = np.cumsum(gaps)
+    elapsed -= np.maximum.accumulate(np.where(first, elapsed, 0))
+    return session, session_start[session] + elapsed, first
+
+
+def _events_chunk(rng, catalogue, brands, rows, first_session, start, seconds):
+    sessions = max(rows // SESSION_EVENTS, 1)
+    session, offsets, first = _session_events(rng, rows, sessions, start, seconds)
+
+    product = rng.choice(len(catalogue), rows, p=_zipf_weights(len(catalogue), 0.9))
+    # Carts are of the product the session looked at just before
+    event_type = np.where(~first & (rng.random(rows) < EVENT_TYPE_WEIGHTS[1]), 1, 0)
+    carts = event_type == 1
+    product[1:][carts[1:]] = product[:-1][carts[1:]]
+
+    # Purchases are of the product last carted earlier in the same session;
+    # events are in time order within a session, and sessions are contiguous
+    position = np.arange(rows)
+    last_cart = np.maximum.accumulate(np.where(carts, position, -1))
+    session_first = np.maximum.accumulate(np.where(first, position, 0))
+    # Views a cart was just taken from stay views
+    eligible = (event_type == 0) & (last_cart >= session_first) & ~np.r_[carts[1:], False] & (rng.random(rows) < 0.5)
+    # At most one purchase per cart, at a random later view of its session
+    candidates = np.flatnonzero(eligible)
+    candidates = candidates[np.unique(last_cart[candidates], return_index=True)[1]]
+    rate = min(EVENT_TYPE_WEIGHTS[2] * rows / max(len(candidates), 1), 1.0)
+    purchases = candidates[rng.random(len(candidates)) < rate]
+    event_type[purchases] = 2
+    product[purchases] = product[last_cart[purchases]]
+
+    order = np.argsort(offsets, kind='stable')
+    session, offsets, product, event_type = session[order], offsets[order], product[order], event_type[order]
+    products = catalogue.iloc[product]
+    category = products['category'].to_numpy()
+
+    users = rng.integers(500_000_000, 570_000_000, sessions)
+    session_ids, session_codes = np.unique(session, return_inverse=True)
+    data = pd.DataFrame({
+        'event_time': pd.to_datetime(offsets, unit='s', utc=True),
+        'event_type': pd.Categorical.from_codes(event_type, EVENT_TYPES),
+        'product_id': products['product_id'].to_numpy(),
+        'category_id': np.where(category >= 0, CATEGORY_ID_BASE + category, CATEGORY_ID_BASE - 1).astype('int64'),
+        'category_code': pd.Categorical.from_codes(category, CATEGORIES),
+        'brand': pd.Categorical.from_codes(products['brand'].to_numpy(), brands),
+        'price': products['price'].to_numpy(),
+        'user_id': users[session].astype('int32'),
+        'user_session': pd.Categorical.from_codes(session_codes, [f's{first_session + number}' for number in session_ids]),
+    })
+    for column, values in time_features(data['event_time']).items():
+        data[column] = values
+    return data
+
+
+def iter_events(rows, days=30, seed=0, start='2019-10-01', chunk_rows=5_000_000, products=50_000, brands=500):
+    """Yield ``rows`` synthetic events over ``days`` days in time-ordered chunks.
+
+    Each chunk covers its own slice of the time range, so concatenated
+    chunks are (nearly) ordered by time like the export; only sessions
+    running past the end of a slice overlap the next one.
+    """
+    catalogue = product_catalogue(products, brands, seed)
+    names = brand_names(brands)
+    chunks = max(-(-rows // chunk_rows), 1)
+    span = days * 86400 // chunks
+    origin = int(pd.Timestamp(start, tz='UTC').timestamp())
+    first_session = 0
+    for number in range(chunks):
+        rng = np.random.default_rng([seed, 2, number])
+        size = rows // chunks + (number < rows % chunks)
+        yield _events_chunk(rng, catalogue, names, size, first_session, origin + number * span, span)
+        first_session += max(size // SESSION_EVENTS, 1)
+
+
+def generate_events(rows, days=30, seed=0, start='2019-10-01', products=50_000, brands=500):
+    """Return ``rows`` synthetic events spread over ``days`` days, in one frame."""
+    return pd.concat(iter_events(rows, days, seed, start, chunk_rows=max(rows, 1), products=products, brands=brands),
+                     ignore_index=True)
+
+
+def _csv_table(chunk):
+    # Arrow formats the timestamps itself, much faster than Series.dt.strftime
+    seconds = pa.array(chunk['event_time'].dt.tz_convert(None).astype('datetime64[s]'))
+    event_time = pyarrow.compute.binary_join_element_wise(pyarrow.compute.cast(seconds, pa.string()), ' UTC', '')
+    table = pa.Table.from_pandas(chunk.assign(price=chunk['price'].astype('float64').round(2)), preserve_index=False)
+    return table.set_column(table.schema.get_field_index('event_time'), 'event_time', event_time)
+
+
+def write_events_csv(data, path):
+    """Write synthetic events, a frame or an iterable of chunks, in the export's CSV layout."""
+    chunks = [data] if isinstance(data, pd.DataFrame) else data
+    for number, chunk in enumerate(chunks):
+        chunk = chunk[[column for column in CSV_COLUMNS if column in chunk]]
+        with open(path, 'wb' if number == 0 else 'ab') as file:
+            if number == 0:
+                file.write((','.join(chunk.columns) + '\n').encode())
+            pyarrow.csv.write_csv(_csv_table(chunk), file, pyarrow.csv.WriteOptions(include_header=False, quoting_style='none'))
+
+
+def parse_size(text):
+    """Row count from a size name such as ``10m`` or a plain number."""
+    return SIZES.get(text.lower()) or int(text.replace('_', ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic events CSV.')
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=parse_size, default='1m', help="rows, or one of: " + ', '.join(SIZES))
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_events_csv(iter_events(args.rows, args.days, args.seed), args.path)
+
+
+if __name__ == '__main__':
+    main()
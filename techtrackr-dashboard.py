@@ -1,25 +1,62 @@
+import functools
+import os
+import threading
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import streamlit_analytics
 
-if 'state_dict' not in st.session_state:
-    st.session_state.state_dict = {}
+from techtrackr import figures, instrument, warmup
+from techtrackr.analytics import EVENT_LABELS, Analytics
+from techtrackr.funnel import FUNNEL_STEPS, STEP_COUNTS
+from techtrackr.ingest import source_columns
+from techtrackr.memo import LRUMemo
+from techtrackr.parallel import get_backend
+from techtrackr.rollup import RollupCube
+from techtrackr.shared import SharedEvents
+from techtrackr.store import EventStore
+from techtrackr.usage import USAGE_DB, UsageStore, UsageTracker, track
+
 # Set page configuration (only once at the start of the script)
 st.set_page_config(page_title="eTrendTracker", layout="wide")
 
 
+# Events export, or a directory of daily partition files
+EVENTS_SOURCE = os.environ.get('TECHTRACKR_EVENTS', 'events.csv')
+
+# Processes used to build the rollup cube; 0 means one per CPU
+AGGREGATION_WORKERS = int(os.environ.get('TECHTRACKR_WORKERS', '1'))
+
+# Most used selections to warm in the background when no current warm-up was
+# persisted by `python -m techtrackr.report --warm`; 0 leaves them cold
+WARM_TOP = int(os.environ.get('TECHTRACKR_WARM_TOP', '0'))
+
+# Dashboard sections rerun on their own when one of their widgets changes;
+# st.fragment was st.experimental_fragment before Streamlit 1.37, and older
+# releases just rerun the whole page
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda function: function)
+
+# Per-stage peak memory via tracemalloc, which slows every allocation; without
+# it stages record the process's peak RSS
+if os.environ.get('TECHTRACKR_TRACE_MEMORY'):
+    instrument.trace_memory()
+
 # Define the different pages
 PAGES = {
     "Home": "home",
     "Dashboard": "dashboard"
 }
 
-# Streamlit pages setup
-selection = st.sidebar.radio("Go to", list(PAGES.keys()))
 
+@st.cache_resource
+def load_tracker():
+    # One tracker per process, writing usage events in the background
+    return UsageTracker(UsageStore())
 
-with streamlit_analytics.track(save_to_json="dashboard.json"):
+
+with track(load_tracker(), "dashboard"):
+    # Streamlit pages setup
+    selection = st.sidebar.radio("Go to", list(PAGES.keys()))
 
     if selection == "Home":
         # Add your code for the "Home" page here
@@ -57,16 +94,45 @@ with streamlit_analytics.track(save_to_json="dashboard.json"):
             pass
     elif selection == "Dashboard":
         st.title("eTrendTracker Dashboard")
-        # Load the dataset
-        @st.cache_data
-        def load_data():
-            data = pd.read_csv('events.csv')
-            return data
+        # Timings of this run, logged as a JSON line once the page is done
+        profile = instrument.Profile('dashboard')
+
+        # Load the pre-aggregated dataset
+        @st.cache_resource
+        def load_rollup():
+            # One cube per process, kept up to date with rows appended to the source
+            return RollupCube(EVENTS_SOURCE, backend=get_backend(AGGREGATION_WORKERS))
+
+        @st.cache_resource(max_entries=1)
+        def load_shared_events(version):
+            # Raw events mapped read-only once per process and shared by every
+            # session; remapped (and rebuilt if stale) when the cube's version moves
+            return SharedEvents.open(EVENTS_SOURCE)
+
+        @st.cache_resource
+        def load_store():
+            # Manifest of the source's partitions, for date-range queries of raw events
+            return EventStore(EVENTS_SOURCE)
+
+        @st.cache_resource
+        def load_memo():
+            # Aggregates and figures per selection, shared by every session
+            return LRUMemo()
+
+        # The first pass streams the whole source in chunks; show how far it got
+        loading = st.empty()
+
+        def show_progress(bytes_read, bytes_total):
+            loading.progress(bytes_read / bytes_total, text=f"Reading events: {bytes_read / 2**20:,.0f} of {bytes_total / 2**20:,.0f} MB")
 
         try:
-            data = load_data()
+            with profile.stage('load_rollup') as record:
+                cube = load_rollup().refresh(show_progress)
+                record['rows'] = len(cube.table)
         except OverflowError:
             st.error("Error: Data contains values larger than the maximum supported integer size in JavaScript (2^53). Please check your data.")
+            st.stop()
+        loading.empty()
 
         # Set a title for your dashboard
         st.title('E-commerce Behavior Dashboard')
@@ -74,15 +140,47 @@ with streamlit_analytics.track(save_to_json="dashboard.json"):
         # Sidebar for filtering options
         st.sidebar.subheader('Filter Data')
 
-        # Filter out rows with missing or non-string values in the 'category_code' column
-        data = data.dropna(subset=['category_code'])
-        data = data[data['category_code'].apply(lambda x: isinstance(x, str))]
-
+        # Date range of every chart; a narrower range than the whole dataset
+        # reads raw events only from the partitions overlapping it
+        dates = None
+        first_day, last_day = cube.date_span()
+        if first_day is not None:
+            selected_dates = st.sidebar.date_input('Select Date Range', (first_day, last_day), min_value=first_day, max_value=last_day)
+            # While a range is being picked the widget holds only its first day
+            selected_dates = tuple(selected_dates) if len(selected_dates) == 2 else (selected_dates[0], last_day)
+            if selected_dates != (first_day, last_day):
+                dates = selected_dates
+
+        # All numbers come from the analytics core.  Results are memoized per
+        # dataset version, category path and date range (plus the event type
+        # where it matters), so changing one widget only computes what depends on it;
+        # cached figures must not be modified afterwards
+        memo = load_memo()
+
+        @st.cache_resource
+        def load_warm(version):
+            # Once per cube version: restore the persisted warm-up into the
+            # memo, or build it in the background without holding up this run
+            restored = warmup.restore(memo, cube)
+            if not restored and WARM_TOP:
+                def run():
+                    warmup.warm_up(cube, USAGE_DB, WARM_TOP)
+                    warmup.restore(memo, cube)
+                threading.Thread(target=run, name='warm-up', daemon=True).start()
+            return restored
+
+        with profile.stage('load_warm'):
+            load_warm(cube.version)
+        core = Analytics(cube, events=lambda: load_shared_events(cube.version), memo=instrument.ProfiledMemo(memo, profile),
+                         store=lambda: load_store().refresh(), dates=dates)
+
+        # The sidebar cascade only looks up nodes of the category tree, built
+        # once per dataset, instead of scanning every row
         # Get unique top-level categories
-        top_level_categories = data['category_code'].apply(lambda x: x.split('.')[0]).unique()
+        top_level_categories = core.children()
 
         # Allow users to select the top-level category
-        selected_top_level_category = st.sidebar.selectbox('Select Top-Level Category', [''] + list(top_level_categories))
+        selected_top_level_category = st.sidebar.selectbox('Select Top-Level Category', [''] + top_level_categories)
 
         # Initialize variables for sub-level categories
         sub_level_categories = []
@@ -91,312 +189,381 @@ with streamlit_analytics.track(save_to_json="dashboard.json"):
 
         if selected_top_level_category:
             # Get sub-level categories based on the selected top-level category
-            sub_level_categories = data[data['category_code'].apply(lambda x: x.startswith(selected_top_level_category))]['category_code'].apply(lambda x: '.'.join(x.split('.')[1:2])).unique()
+            sub_level_categories = core.children(selected_top_level_category)
             # Allow users to select the first sub-level category
-            selected_sub_level_category1 = st.sidebar.selectbox('Select First Sub-Level Category', [''] + list(sub_level_categories))
+            selected_sub_level_category1 = st.sidebar.selectbox('Select First Sub-Level Category', [''] + sub_level_categories)
 
         if selected_sub_level_category1:
             # Get sub-level categories based on the selected top-level and first sub-level categories
-            sub_level_categories2 = data[
-                (data['category_code'].apply(lambda x: x.startswith(selected_top_level_category + '.' + selected_sub_level_category1)))
-            ]['category_code'].apply(lambda x: '.'.join(x.split('.')[2:])).unique()
+            sub_level_categories2 = core.children(selected_top_level_category, selected_sub_level_category1)
 
             if len(sub_level_categories2) > 0:
                 # Allow users to select the second sub-level category
-                selected_sub_level_category2 = st.sidebar.selectbox('Select Second Sub-Level Category', [''] + list(sub_level_categories2))
-
-        # Check if any sub-level category is selected and filter data accordingly
-        if selected_sub_level_category2:
-            filtered_data = data[
-                (data['category_code'].apply(lambda x: x.startswith(selected_top_level_category + '.' + selected_sub_level_category1 + '.' + selected_sub_level_category2)))
-            ]
-        elif selected_sub_level_category1:
-            filtered_data = data[
-                (data['category_code'].apply(lambda x: x.startswith(selected_top_level_category + '.' + selected_sub_level_category1)))
-            ]
-        elif selected_top_level_category:
-            filtered_data = data[
-                (data['category_code'].apply(lambda x: x.startswith(selected_top_level_category)))
-            ]
-        else:
-            # If no filters are selected, show all data
-            filtered_data = data
-
-        purchase_data = filtered_data[filtered_data['event_type'] == 'purchase']
-        # Filter data for 'view' events
-        view_data = filtered_data[filtered_data['event_type'] == 'view']
-        # Filter data for 'cart' events
-        cart_data = filtered_data[filtered_data['event_type'] == 'cart']
-
-        # Create a container for the most common brand and category
-        brand_category_container = st.container()
-
-        # Within the container, create a selectbox for event type
-        with brand_category_container:
-            event_type = st.selectbox('Select Event Type', ['purchase', 'view', 'cart'], index=0)
-
-            # Determine the data based on the selected event type
-            if event_type == 'purchase':
-                selected_data = purchase_data
-                event_title = 'Purchased Products'
-            elif event_type == 'view':
-                selected_data = view_data
-                event_title = 'Viewed Products'
-            else:
-                selected_data = cart_data
-                event_title = 'Products Added to Cart'
-
-        # Display the most common brand and category for the selected event type
-        if len(selected_data) > 0:
-            if selected_sub_level_category2:
-                event_title = selected_sub_level_category2.capitalize()
-            elif selected_sub_level_category1:
-                event_title = selected_sub_level_category1.capitalize()
-            else:
-                if selected_top_level_category:
-                    event_title = selected_top_level_category.capitalize()
+                selected_sub_level_category2 = st.sidebar.selectbox('Select Second Sub-Level Category', [''] + sub_level_categories2)
+
+        # Selected category path; an empty path covers every categorized event
+        category_path = [level for level in (selected_top_level_category, selected_sub_level_category1, selected_sub_level_category2) if level]
+
+        def memoized(name, compute, *key):
+            return core.memo.get((cube.version, tuple(category_path), name, dates) + key, compute)
+
+        # Serialized size of every figure sent to the browser on this run
+        figure_payloads = {}
+
+        def show_figure(name, compute, *key):
+            fig, payload = memoized(name, lambda: figures.sized(compute()), *key)
+            figure_payloads[name] = payload
+            with profile.stage(f'{name}.render'):
+                st.plotly_chart(fig)
+
+        def section(function):
+            """Fragment whose reruns are profiled and logged on their own."""
+            @functools.wraps(function)
+            def profiled():
+                with profile.section(function.__name__):
+                    function()
+            return fragment(profiled)
+
+        # Event count per event type for the selected categories
+        event_totals = core.event_totals(*category_path)
+
+        # The event type only affects this section, so changing it reruns just
+        # this fragment instead of the whole page
+        @section
+        def brand_category_section():
+            # Create a container for the most common brand and category
+            brand_category_container = st.container()
+
+            # Within the container, create a selectbox for event type
+            with brand_category_container:
+                event_type = st.selectbox('Select Event Type', ['purchase', 'view', 'cart'], index=0)
+
+                # Determine the data based on the selected event type
+                selected_count = event_totals.get(event_type, 0)
+                if event_type == 'purchase':
+                    event_title = 'Purchased Products'
+                elif event_type == 'view':
+                    event_title = 'Viewed Products'
                 else:
-                    event_title = ""
+                    event_title = 'Products Added to Cart'
+
+            # Display the most common brand and category for the selected event type
+            if selected_count > 0:
+                if selected_sub_level_category2:
+                    event_title = selected_sub_level_category2.capitalize()
+                elif selected_sub_level_category1:
+                    event_title = selected_sub_level_category1.capitalize()
+                else:
+                    if selected_top_level_category:
+                        event_title = selected_top_level_category.capitalize()
+                    else:
+                        event_title = ""
+
+                most_common_brand = core.most_common('brand', *category_path, event_type=event_type, default='Unknown').capitalize()
+                most_common_category = core.most_common('category_code', *category_path, event_type=event_type, default='Unknown').split('.')[-1].capitalize()
+
+                col1, col2 = st.columns(2)
+
+                with col1:
+                    st.error(f"""
+                    #### Most Common Brand{f" for {event_title}" if event_title else ""}
+                    # {most_common_brand}
+                    """)
+
+                    # Create a single bar chart for the most common brands
+                    def brand_figure():
+                        brand_counts = core.top('brand', *category_path, event_type=event_type, k=10)
+                        return px.bar(
+                            x=brand_counts.index,
+                            y=brand_counts.values,
+                            labels={'x': 'Brand', 'y': 'Count'},
+                            title=f'Top 10 Most Common Brands for {event_title}',
+                        )
 
-            most_common_brand = selected_data['brand'].mode().iloc[0].capitalize()
-            most_common_category = selected_data['category_code'].mode().iloc[0].split('.')[-1].capitalize()
+                    show_figure('fig_brand', brand_figure, event_type)
+
+                with col2:
+                    st.error(f"""
+                    #### Most Common Category{f" for {event_title}" if event_title else ""}
+                    # {most_common_category}
+                    """)
+
+                    # Create a single bar chart for the most common categories
+                    def category_figure():
+                        category_counts = core.top('category', *category_path, event_type=event_type, k=10)
+                        return px.bar(
+                            x=category_counts.index,
+                            y=category_counts.values,
+                            labels={'x': 'Category', 'y': 'Count'},
+                            title=f'Top 10 Most Common Categories for {event_title}',
+                        )
 
-            col1, col2 = st.columns(2)
+                    show_figure('fig_category', category_figure, event_type)
 
-            with col1:
-                st.error(f"""
-                #### Most Common Brand{f" for {event_title}" if event_title else ""}
-                # {most_common_brand}
-                """)
-
-                # Create a single bar chart for the most common brands
-                brand_counts = selected_data['brand'].value_counts().head(10)
-                fig_brand = px.bar(
-                    x=brand_counts.index,
-                    y=brand_counts.values,
-                    labels={'x': 'Brand', 'y': 'Count'},
-                    title=f'Top 10 Most Common Brands for {event_title}',
-                )
-                st.plotly_chart(fig_brand)
+                # Product drill-down: the only part of the page that reads raw events,
+                # so it runs on demand against the shared, memory-mapped copy
+                if st.checkbox('Show Top Products'):
+                    st.dataframe(core.top_products(*category_path, event_type=event_type, k=10))
 
-            with col2:
-                st.error(f"""
-                #### Most Common Category{f" for {event_title}" if event_title else ""}
-                # {most_common_category}
-                """)
-
-                # Create a single bar chart for the most common categories
-                category_counts = selected_data['category_code'].apply(lambda x: x.split('.')[-1]).value_counts().head(10)
-                fig_category = px.bar(
-                    x=category_counts.index,
-                    y=category_counts.values,
-                    labels={'x': 'Category', 'y': 'Count'},
-                    title=f'Top 10 Most Common Categories for {event_title}',
-                )
-                st.plotly_chart(fig_category)
-
-        else:
-            if selected_top_level_category:
-                st.warning(f"No data available for the selected event type: {event_title.capitalize()}")
             else:
-                st.warning("Please select a category to display results.")
+                if selected_top_level_category:
+                    st.warning(f"No data available for the selected event type: {event_title.capitalize()}")
+                else:
+                    st.warning("Please select a category to display results.")
+
+        brand_category_section()
+
+
+        # The remaining sections compute only once opened, and each reruns on its
+        # own when its toggle changes
+        @section
+        def event_summary_section():
+            if not st.toggle('Show Event Summary', key='show_event_summary'):
+                return
+
+            # Create a container for the entire layout
+            with st.container():
+                # Use columns for responsive columns
+                col1, col2 = st.columns(2)
+
+                # Column 1: PIE CHART (Stretches to full width)
+                with col1:
+                    def summary_figure():
+                        # Total events, average price and most common brand per event type
+                        summary_df = core.summary_table(*category_path)
+
+                        # Create a pie chart for the distribution of total products
+                        fig = px.pie(
+                            summary_df,
+                            values='Total Products',
+                            names='Event Type',
+                            title='Distribution of Total Products by Event Type'
+                        )
 
+                        # Set the width and height for the chart
+                        fig.update_layout(width=600, height=600)
+                        return fig
+
+                    # Display the pie chart
+                    st.write("### Distribution of Total Products by Event Type")
+                    show_figure('fig_summary', summary_figure)
+
+                # Column 2: Category Analysis (Takes up default space)
+                with col2:
+                    # Title for the analysis
+                    st.write("### Cart Additions vs. Successful Purchases")
+
+                    # Category-wise Analysis
+                    if event_totals.sum() > 0:
+                        # Create a bar chart to visualize the number of 'added to cart' and 'purchased' events for all categories
+                        total_cart_products = event_totals.get('cart', 0)
+                        total_purchased_products = event_totals.get('purchase', 0)
+                        if total_cart_products > 0 or total_purchased_products > 0:
+                            def cart_purchase_figure():
+                                category_event_counts = core.cart_vs_purchase(*category_path)
+
+                                fig_all_categories_events = px.bar(
+                                    category_event_counts,
+                                    x='Event Type',
+                                    y='Number of Events',
+                                    labels={'Event Type': 'Event Type', 'Number of Events': 'Number of Events'},
+                                )
+
+                                # Set the width and height for the chart
+                                fig_all_categories_events.update_layout(width=600, height=600)
+                                return fig_all_categories_events
+
+                            # Display the bar chart for all categories
+                            show_figure('fig_cart_purchase', cart_purchase_figure)
+                        else:
+                            st.info("No 'Added to Cart' or 'Purchased' events found for the selected filters.")
+                    else:
+                        st.warning("No data available for the selected filters.")
 
-        #### STOP
+        event_summary_section()
 
-        # ... (previous code)
 
-        import streamlit as st
-        import pandas as pd
-        import plotly.express as px
+        def format_duration(seconds):
+            if pd.isna(seconds):
+                return "n/a"
+            return f"{seconds / 60:.1f} min" if seconds >= 60 else f"{seconds:.0f} s"
 
-        # ... (previous code)
+        # Conversion funnel: each product a session viewed, then added to cart,
+        # then purchased.  Built from the raw events once per dataset, after
+        # which every selection and breakdown is a small groupby
+        @section
+        def conversion_funnel_section():
+            st.write("## Conversion Funnel")
+            st.write("Follow the products viewed in each session through to the cart and to purchase.")
+            if not st.toggle('Show Conversion Funnel', key='show_conversion_funnel'):
+                return
 
-        # Create a container for the entire layout
-        with st.container():
-            # Use columns for responsive columns
-            col1, col2 = st.columns(2)
+            # Read from the header: opening the shared events would rebuild them for a date window
+            if 'user_session' not in source_columns(EVENTS_SOURCE):
+                st.info("The events have no user_session column to follow sessions by.")
+                return
 
-            # Column 1: PIE CHART (Stretches to full width)
+            overall = core.funnel(*category_path).iloc[0]
+            if overall['views'] == 0:
+                st.warning("No data available for the selected filters.")
+                return
+
+            col1, col2 = st.columns([2, 1])
             with col1:
-                # Calculate statistics for 'viewed' events
-                total_viewed_products = len(view_data)
-                average_viewed_price = view_data['price'].mean()
-                most_common_viewed_brand = view_data['brand'].mode().iloc[0]
-
-                # Calculate statistics for 'added to cart' events
-                total_cart_products = len(cart_data)
-                average_cart_price = cart_data['price'].mean()
-                most_common_cart_brand = cart_data['brand'].mode().iloc[0]
-
-                # Calculate statistics for 'purchased' events
-                total_purchased_products = len(purchase_data)
-                average_purchased_price = purchase_data['price'].mean()
-                most_common_purchased_brand = purchase_data['brand'].mode().iloc[0]
-
-                # Create a summary table to compare the statistics
-                summary_data = {
-                    'Event Type': ['Viewed', 'Added to Cart', 'Purchased'],
-                    'Total Products': [total_viewed_products, total_cart_products, total_purchased_products],
-                    'Average Price': [average_viewed_price, average_cart_price, average_purchased_price],
-                    'Most Common Brand': [most_common_viewed_brand, most_common_cart_brand, most_common_purchased_brand]
-                }
-
-                # Convert the summary data to a DataFrame
-                summary_df = pd.DataFrame(summary_data)
-
-                import plotly.express as px
-
-                # Create a pie chart for the distribution of total products
-                fig = px.pie(
-                    summary_df,
-                    values='Total Products',
-                    names='Event Type',
-                    title='Distribution of Total Products by Event Type'
-                )
-
-                # Set the width and height for the chart
-                fig.update_layout(width=600, height=600)
-
-                # Display the pie chart
-                st.write("### Distribution of Total Products by Event Type")
-                st.plotly_chart(fig)
+                def funnel_figure():
+                    return px.funnel(
+                        x=[overall[step] for step in STEP_COUNTS],
+                        y=[EVENT_LABELS[step] for step in FUNNEL_STEPS],
+                        labels={'x': 'Products', 'y': 'Step'},
+                        title='Products Viewed, Added to Cart and Purchased per Session',
+                    )
+
+                show_figure('fig_funnel', funnel_figure)
 
-            # Column 2: Category Analysis (Takes up default space)
             with col2:
-                # Title for the analysis
-                st.write("### Cart Additions vs. Successful Purchases")
-
-                # Category-wise Analysis
-                if len(filtered_data) > 0:
-                    # Create a bar chart to visualize the number of 'added to cart' and 'purchased' events for all categories
-                    if len(cart_data) > 0 or len(purchase_data) > 0:
-                        category_event_counts = pd.DataFrame({
-                            'Event Type': ['Added to Cart', 'Purchased'],
-                            'Number of Events': [len(cart_data), len(purchase_data)]
-                        })
-
-                        fig_all_categories_events = px.bar(
-                            category_event_counts,
-                            x='Event Type',
-                            y='Number of Events',
-                            labels={'Event Type': 'Event Type', 'Number of Events': 'Number of Events'},
-                        )
+                st.metric('View to Cart', f"{overall['cart_rate']:.2%}")
+                st.metric('Cart to Purchase', f"{overall['purchase_rate']:.2%}" if pd.notna(overall['purchase_rate']) else "n/a")
+                st.metric('Median Time to Cart', format_duration(overall['median_time_to_cart']))
+                st.metric('Median Time to Purchase', format_duration(overall['median_time_to_purchase']))
 
-                        # Set the width and height for the chart
-                        fig_all_categories_events.update_layout(width=600, height=600)
+            # Conversion of the most viewed brands or categories
+            breakdown = st.radio('Break Down Funnel by', ['Brand', 'Category'], horizontal=True)
+            conversion = core.funnel(*category_path, by=breakdown.lower()).head(10)
+            st.dataframe(conversion.style.format({
+                'cart_rate': '{:.2%}', 'purchase_rate': '{:.2%}', 'conversion_rate': '{:.3%}',
+                'median_time_to_cart': format_duration, 'median_time_to_purchase': format_duration,
+            }, na_rep='n/a'))
 
-                        # Display the bar chart for all categories
-                        st.plotly_chart(fig_all_categories_events)
-                    else:
-                        st.info("No 'Added to Cart' or 'Purchased' events found for the selected filters.")
-                else:
-                    st.warning("No data available for the selected filters.")
+        conversion_funnel_section()
 
 
         # ... (previous code)
 
-        # Brand Analysis: Explore the popularity of different brands within each category, and visualize brand preferences among users.
-        st.write("## Brand Analysis")
-        st.write("Explore the popularity of different brands within each category, and visualize brand preferences among users.")
+        @section
+        def brand_analysis_section():
+            # Brand Analysis: Explore the popularity of different brands within each category, and visualize brand preferences among users.
+            st.write("## Brand Analysis")
+            st.write("Explore the popularity of different brands within each category, and visualize brand preferences among users.")
+            if not st.toggle('Show Brand Analysis', key='show_brand_analysis'):
+                return
+
+            # Calculate brand popularity within each category
+            if event_totals.sum() > 0:
+                def brand_analysis_figure():
+                    # Event counts per subcategory and brand
+                    category_brand_counts = core.brand_preferences(*category_path)
+
+                    # Create a treemap to visualize brand preferences within each
+                    # subcategory; the long tail of small brands is shown as "Other"
+                    fig_brand_analysis = figures.treemap(
+                        category_brand_counts,
+                        path=['subcategory', 'brand'],
+                        values='count',
+                        title='Brand Preferences Within Each Subcategory',
+                        labels={'subcategory': 'Subcategory', 'count': 'Count', 'brand': 'Brand'},
+                        hover_data={'count': False},  # Display count without hovering
+                    )
+
+                    # Set the font size, width, and height for the chart
+                    fig_brand_analysis.update_layout(
+                        font=dict(size=18),  # Increase font size
+                        width=1600,
+                        height=800,
+                    )
+                    return fig_brand_analysis
+
+                # Display the brand analysis treemap
+                show_figure('fig_brand_analysis', brand_analysis_figure)
+            else:
+                st.warning("No data available for the selected filters.")
 
-        # Calculate brand popularity within each category
-        if len(filtered_data) > 0:
-            # Extract the subcategory from the 'category_code' column
-            category_brand_counts = filtered_data.groupby(['category_code', 'brand']).size().reset_index(name='count')
-            category_brand_counts['subcategory'] = category_brand_counts['category_code'].str.split('.').str[-1].str.capitalize()
+        brand_analysis_section()
 
-            # Create a treemap to visualize brand preferences within each subcategory
-            fig_brand_analysis = px.treemap(
-                category_brand_counts,
-                path=['subcategory', 'brand'],
-                values='count',
-                title='Brand Preferences Within Each Subcategory',
-                labels={'subcategory': 'Subcategory', 'count': 'Count', 'brand': 'Brand'},
-                hover_data={'count': False},  # Display count without hovering
-            )
 
-            # Set the font size, width, and height for the chart
-            fig_brand_analysis.update_layout(
-                font=dict(size=18),  # Increase font size
-                width=1600,
-                height=800,
-            )
 
-            # Display the brand analysis treemap
-            st.plotly_chart(fig_brand_analysis)
-        else:
-            st.warning("No data available for the selected filters.")
+        # ... (your existing code)
+        @section
+        def event_trends_section():
+            if not st.toggle('Show Event Trends', key='show_event_trends'):
+                return
+
+            # Daily and hourly counts for every event type from one pass over the
+            # selected categories; missing days and hours are filled with zeros
+            daily_event_counts = core.daily_counts(*category_path)
+            hourly_event_counts = core.hourly_counts(*category_path)
+
+            # Create a container with two rows
+            container = st.container()
+
+            # Row 1: Daily and Hourly View Event Chart
+            with container:
+                row1 = st.columns(2)
+                with row1[0]:
+                    # Daily Event Count for View
+                    def daily_view_figure():
+                        daily_event_fig_view = figures.line(daily_event_counts, x='event_date', y='count_view',
+                            labels={'count_view': 'Daily View Event Count', 'event_date': 'Date'}, title='Daily View Event Counts'
+                        )
+                        daily_event_fig_view.update_xaxes(title_text='Date')
+                        daily_event_fig_view.update_yaxes(title_text='Number of View Events')
+                        return daily_event_fig_view
 
+                    show_figure('daily_event_fig_view', daily_view_figure)
 
+                with row1[1]:
+                    # Hourly Event Count for View
+                    def hourly_view_figure():
+                        hourly_event_fig_view = figures.line(hourly_event_counts, x='event_hour', y='count_view',
+                            labels={'count_view': 'Hourly View Event Count', 'event_hour': 'Hour of the Day'}, title='Hourly View Event Counts'
+                        )
+                        hourly_event_fig_view.update_xaxes(title_text='Hour of the Day')
+                        hourly_event_fig_view.update_yaxes(title_text='Number of View Events')
+                        return hourly_event_fig_view
+
+                    show_figure('hourly_event_fig_view', hourly_view_figure)
+
+            # Row 2: Daily and Hourly Added to Cart and Purchased Event Chart
+            with container:
+                row2 = st.columns(2)
+                with row2[0]:
+                    # Daily Event Count for Added to Cart
+                    def daily_cart_purchase_figure():
+                        daily_event_fig_cart_purchase = figures.line(daily_event_counts, x='event_date', y=['count_cart', 'count_purchase'],
+                            labels={'count_cart': 'Daily Added to Cart Event Count', 'count_purchase': 'Daily Purchased Event Count', 'event_date': 'Date'},
+                            title='Daily Added to Cart and Purchased Event Counts'
+                        )
+                        daily_event_fig_cart_purchase.update_xaxes(title_text='Date')
+                        daily_event_fig_cart_purchase.update_yaxes(title_text='Number of Events')
+                        return daily_event_fig_cart_purchase
+
+                    show_figure('daily_event_fig_cart_purchase', daily_cart_purchase_figure)
+
+                with row2[1]:
+                    # Hourly Event Count for Added to Cart
+                    def hourly_cart_purchase_figure():
+                        hourly_event_fig_cart_purchase = figures.line(hourly_event_counts, x='event_hour', y=['count_cart', 'count_purchase'],
+                            labels={'count_cart': 'Hourly Added to Cart Event Count', 'count_purchase': 'Hourly Purchased Event Count', 'event_hour': 'Hour of the Day'},
+                            title='Hourly Added to Cart and Purchased Event Counts'
+                        )
+                        hourly_event_fig_cart_purchase.update_xaxes(title_text='Hour of the Day')
+                        hourly_event_fig_cart_purchase.update_yaxes(title_text='Number of Events')
+                        return hourly_event_fig_cart_purchase
+
+                    show_figure('hourly_event_fig_cart_purchase', hourly_cart_purchase_figure)
+
+        event_trends_section()
 
         # ... (your existing code)
-        # Convert the 'event_time' column to a datetime object
-        data['event_time'] = pd.to_datetime(data['event_time'])
-
-        # Extract the date and hour from the 'event_time' column
-        data['event_date'] = data['event_time'].dt.date
-        data['event_hour'] = data['event_time'].dt.hour
-
-        # Create a container with two rows
-        container = st.container()
-
-        # Row 1: Daily and Hourly View Event Chart
-        with container:
-            row1 = st.columns(2)
-            with row1[0]:
-                # Daily Event Count for View
-                daily_event_counts_view = data[data['event_type'] == 'view'].groupby(['event_date']).size().reset_index(name='count')
-                daily_event_fig_view = px.line(daily_event_counts_view, x='event_date', y='count',
-                    labels={'count': 'Daily View Event Count', 'event_date': 'Date'}, title='Daily View Event Counts'
-                )
-                daily_event_fig_view.update_xaxes(title_text='Date')
-                daily_event_fig_view.update_yaxes(title_text='Number of View Events')
-                st.plotly_chart(daily_event_fig_view)
-
-            with row1[1]:
-                # Hourly Event Count for View
-                hourly_event_counts_view = data[data['event_type'] == 'view'].groupby(['event_hour']).size().reset_index(name='count')
-                hourly_event_fig_view = px.line(hourly_event_counts_view, x='event_hour', y='count',
-                    labels={'count': 'Hourly View Event Count', 'event_hour': 'Hour of the Day'}, title='Hourly View Event Counts'
-                )
-                hourly_event_fig_view.update_xaxes(title_text='Hour of the Day')
-                hourly_event_fig_view.update_yaxes(title_text='Number of View Events')
-                st.plotly_chart(hourly_event_fig_view)
-
-        # Row 2: Daily and Hourly Added to Cart and Purchased Event Chart
-        with container:
-            row2 = st.columns(2)
-            with row2[0]:
-                # Daily Event Count for Added to Cart
-                daily_event_counts_cart = data[data['event_type'] == 'cart'].groupby(['event_date']).size().reset_index(name='count')
-                daily_event_counts_purchase = data[data['event_type'] == 'purchase'].groupby(['event_date']).size().reset_index(name='count')
-                daily_event_counts_cart_purchase = daily_event_counts_cart.merge(
-                    daily_event_counts_purchase, on='event_date', suffixes=('_cart', '_purchase')
-                )
-
-                daily_event_fig_cart_purchase = px.line(daily_event_counts_cart_purchase, x='event_date', y=['count_cart', 'count_purchase'],
-                    labels={'count_cart': 'Daily Added to Cart Event Count', 'count_purchase': 'Daily Purchased Event Count', 'event_date': 'Date'},
-                    title='Daily Added to Cart and Purchased Event Counts'
-                )
-                daily_event_fig_cart_purchase.update_xaxes(title_text='Date')
-                daily_event_fig_cart_purchase.update_yaxes(title_text='Number of Events')
-                st.plotly_chart(daily_event_fig_cart_purchase)
-
-            with row2[1]:
-                # Hourly Event Count for Added to Cart
-                hourly_event_counts_cart = data[data['event_type'] == 'cart'].groupby(['event_hour']).size().reset_index(name='count')
-                hourly_event_counts_purchase = data[data['event_type'] == 'purchase'].groupby(['event_hour']).size().reset_index(name='count')
-                hourly_event_counts_cart_purchase = hourly_event_counts_cart.merge(
-                    hourly_event_counts_purchase, on='event_hour', suffixes=('_cart', '_purchase')
-                )
-
-                hourly_event_fig_cart_purchase = px.line(hourly_event_counts_cart_purchase, x='event_hour', y=['count_cart', 'count_purchase'],
-                    labels={'count_cart': 'Hourly Added to Cart Event Count', 'count_purchase': 'Hourly Purchased Event Count', 'event_hour': 'Hour of the Day'},
-                    title='Hourly Added to Cart and Purchased Event Counts'
-                )
-                hourly_event_fig_cart_purchase.update_xaxes(title_text='Hour of the Day')
-                hourly_event_fig_cart_purchase.update_yaxes(title_text='Number of Events')
-                st.plotly_chart(hourly_event_fig_cart_purchase)
-
-        # ... (your existing code)
\ No newline at end of file
+
+        # Bytes each chart sent to the browser, against the payload budget
+        with st.sidebar.expander('Figure payloads'):
+            st.dataframe(pd.DataFrame.from_dict(figure_payloads, orient='index'))
+
+        # Optional debug panel with this run's stages; sections rerun on their
+        # own later are only logged
+        profile.finish()
+        if st.sidebar.toggle('Debug panel'):
+            with st.sidebar.expander('Timings', expanded=True):
+                st.write(f"Run: {sum(stage['seconds'] for stage in profile.stages if stage['depth'] == 0):.3f}s in stages")
+                st.dataframe(profile.frame())
+                st.write('Memo', memo.stats())
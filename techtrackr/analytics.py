@@ -0,0 +1,186 @@
+"""Dashboard analytics as a query API over the rollup cube.
+
+Every number and table the Dashboard shows is computed here, from a
+:class:`~techtrackr.rollup.RollupCube` (and, for the product drill-down,
+:class:`~techtrackr.shared.SharedEvents`), for a category path and
+optionally an event type.  Nothing depends on Streamlit, so the same queries
+serve the page, the benchmarks and the batch reports of
+``python -m techtrackr.report``.
+"""
+import numpy as np
+import pandas as pd
+
+from techtrackr.categories import DEPTH
+from techtrackr.funnel import COLUMNS as FUNNEL_COLUMNS, Funnel
+from techtrackr.timeseries import EVENT_TYPES, daily_counts, hourly_counts
+from techtrackr.topk import top_k
+
+
+# How the Dashboard labels each event type
+EVENT_LABELS = {'view': 'Viewed', 'cart': 'Added to Cart', 'purchase': 'Purchased'}
+
+# Per-selection tables written by the batch reports
+REPORTS = ['summary_table', 'cart_vs_purchase', 'brand_preferences', 'daily_counts', 'hourly_counts']
+
+# Raw events above which Top Products only aggregates the likely top products
+APPROXIMATE_ROWS = 5_000_000
+
+
+def _candidates(product_ids, k):
+    """Mask of the events of the (about) ``2 * k`` most frequent products.
+
+    Picked with :func:`~techtrackr.topk.top_k`'s bounded-memory sketches; the
+    margin leaves room for their overcounting, and the candidates' events
+    are then counted exactly.
+    """
+    top = top_k(product_ids, 2 * k, approximate=True)
+    return np.isin(product_ids, top.index.to_numpy())
+
+
+class Analytics:
+    """Queries over ``cube`` for a category path and event type.
+
+    ``events`` is a callable returning the :class:`SharedEvents` of the same
+    source; it is only called by :meth:`top_products` and :meth:`funnels`.
+    With a ``dates`` window, a ``(first, last)`` pair of days both included,
+    every query covers those days only, and those two read the raw events
+    from the partitions overlapping the window: ``store`` is then a callable
+    returning the source's :class:`~techtrackr.store.EventStore`.  With
+    ``memo`` (an object with ``get(key, compute)`` such as
+    :class:`~techtrackr.memo.LRUMemo`) results are memoized under
+    ``(cube.version, path, query, dates, *arguments)``; they must then be
+    treated as read-only.
+    """
+
+    def __init__(self, cube, events=None, memo=None, store=None, dates=None):
+        self.cube = cube
+        self._events = events
+        self.memo = memo
+        self._store = store
+        self.dates = tuple(dates) if dates is not None else None
+
+    def _cached(self, name, path, compute, *key):
+        if self.memo is None:
+            return compute()
+        return self.memo.get((self.cube.version, tuple(path), name, self.dates) + key, compute)
+
+    def children(self, *path):
+        """Category names one level below ``path``, as in the sidebar cascade."""
+        return self.cube.category_index.children(*path)
+
+    def category_paths(self, depth=DEPTH):
+        """Every category path down to ``depth`` levels, the empty path first."""
+        paths, pending = [], [()]
+        while pending:
+            path = pending.pop()
+            paths.append(path)
+            if len(path) < depth:
+                pending.extend((*path, child) for child in reversed(self.children(*path)))
+        return paths
+
+    def event_summary(self, *path):
+        """Event count and average price per event type."""
+        return self._cached('event_summary', path, lambda: self.cube.event_summary(*path, dates=self.dates))
+
+    def event_totals(self, *path):
+        """Event count per event type."""
+        return self.event_summary(*path)['count']
+
+    def rankings(self, *path):
+        """:class:`~techtrackr.topk.Rankings` of brand, category code and leaf category."""
+        return self._cached('rankings', path, lambda: self.cube.rankings(*path, dates=self.dates))
+
+    def top(self, column, *path, event_type=None, k=10):
+        """The ``k`` most frequent values of ``column`` ('brand', 'category_code' or 'category')."""
+        return self.rankings(*path).top(column, event_type, k)
+
+    def most_common(self, column, *path, event_type=None, default=None):
+        return self.rankings(*path).most_common(column, event_type, default)
+
+    def summary_table(self, *path):
+        """Total events, average price and most common brand per event type."""
+        def compute():
+            event_stats = self.event_summary(*path).reindex(EVENT_TYPES)
+            rankings = self.rankings(*path)
+            return pd.DataFrame({
+                'Event Type': [EVENT_LABELS[event_type] for event_type in EVENT_TYPES],
+                'Total Products': event_stats['count'].fillna(0).astype(int).tolist(),
+                'Average Price': event_stats['average_price'].tolist(),
+                'Most Common Brand': [rankings.most_common('brand', event_type) for event_type in EVENT_TYPES],
+            })
+        return self._cached('summary_table', path, compute)
+
+    def cart_vs_purchase(self, *path):
+        """Number of cart and purchase events."""
+        def compute():
+            totals = self.event_totals(*path)
+            return pd.DataFrame({
+                'Event Type': [EVENT_LABELS['cart'], EVENT_LABELS['purchase']],
+                'Number of Events': [int(totals.get('cart', 0)), int(totals.get('purchase', 0))],
+            })
+        return self._cached('cart_vs_purchase', path, compute)
+
+    def brand_preferences(self, *path):
+        """Event counts per (category_code, brand), with the leaf as ``subcategory``."""
+        def compute():
+            counts = self.cube.counts(['category_code', 'brand'], *path, dates=self.dates).reset_index(name='count')
+            counts['subcategory'] = counts['category_code'].str.split('.').str[-1].str.capitalize()
+            return counts
+        return self._cached('brand_preferences', path, compute)
+
+    def time_series(self, *path):
+        """Wide (event_date, event_hour) x event type counts."""
+        return self._cached('time_series', path, lambda: self.cube.time_series(*path, dates=self.dates))
+
+    def daily_counts(self, *path):
+        """Per-day ``count_<event type>`` columns, missing days filled with zeros."""
+        return self._cached('daily_counts', path,
+                            lambda: daily_counts(self.time_series(*path)).add_prefix('count_').reset_index())
+
+    def hourly_counts(self, *path):
+        """Per-hour-of-day ``count_<event type>`` columns for all 24 hours."""
+        return self._cached('hourly_counts', path,
+                            lambda: hourly_counts(self.time_series(*path)).add_prefix('count_').reset_index())
+
+    def top_products(self, *path, event_type=None, k=10):
+        """The ``k`` products with the most events, read from the raw events.
+
+        Slices of more than :data:`APPROXIMATE_ROWS` events are first narrowed
+        to candidate products with :func:`~techtrackr.topk.top_k`, so only
+        their rows are gathered and grouped.
+        """
+        def compute():
+            if self.dates is None:
+                events = self._events()
+                rows = events.rows(*path, event_type=event_type)
+                if len(rows) > APPROXIMATE_ROWS:
+                    rows = rows[_candidates(events.column('product_id', rows).to_numpy(), k)]
+                products = events.frame(['product_id', 'brand', 'price'], rows)
+            else:
+                products = self._store().load(*path, dates=self.dates, event_type=event_type,
+                                              columns=['product_id', 'brand', 'price'])
+                if len(products) > APPROXIMATE_ROWS:
+                    products = products[_candidates(products['product_id'].to_numpy(), k)]
+            return products.groupby('product_id').agg(
+                events=('price', 'size'),
+                brand=('brand', 'first'),
+                average_price=('price', 'mean'),
+            ).nlargest(k, 'events')
+        return self._cached('top_products', path, compute, event_type, k)
+
+    def funnels(self):
+        """:class:`~techtrackr.funnel.Funnel` of the raw events, built once per dataset version and window."""
+        def compute():
+            if self.dates is None:
+                return Funnel.from_events(self._events())
+            return Funnel.from_frame(self._store().load(dates=self.dates, columns=FUNNEL_COLUMNS))
+        return self._cached('funnels', (), compute)
+
+    def funnel(self, *path, by=None):
+        """View -> cart -> purchase conversion of sessions' products, per ``by``
+        ('brand', 'category_code', 'category') or overall."""
+        return self._cached('funnel', path, lambda: self.funnels().conversion(*path, by=by), by)
+
+    def report(self, *path):
+        """Every table in :data:`REPORTS` for ``path``, by name."""
+        return {name: getattr(self, name)(*path) for name in REPORTS}
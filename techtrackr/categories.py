@@ -0,0 +1,109 @@
+"""Category hierarchy index over the dotted ``category_code`` column.
+
+``category_code`` values look like ``appliances.kitchen.refrigerators``.  The
+dashboard lets users drill down three levels (top, first sub-level, and the
+remainder as second sub-level).  Instead of splitting and prefix-matching
+every row on each rerun, the tree is built once from the handful of distinct
+codes, and rows are grouped by code so a selection costs O(matches).
+"""
+import numpy as np
+import pandas as pd
+
+
+# Number of drill-down levels offered in the sidebar; anything deeper is
+# folded into the last level, e.g. "a.b.c.d" -> ("a", "b", "c.d")
+DEPTH = 3
+
+
+def split_code(code):
+    """Split a category code into at most ``DEPTH`` path components."""
+    parts = code.split('.')
+    if len(parts) > DEPTH:
+        parts = parts[:DEPTH - 1] + ['.'.join(parts[DEPTH - 1:])]
+    return tuple(parts)
+
+
+class CategoryIndex:
+    """Tree of category paths with the row positions of every node.
+
+    Built once per dataset with :meth:`from_series`.  Paths are tuples of
+    level names, ``()`` being the root (every row with a category).
+    """
+
+    def __init__(self, codes, categories):
+        self.categories = pd.Index(categories)
+        codes = np.asarray(codes)
+
+        # Stable sort by code: rows of code ``i`` are order[bounds[i]:bounds[i + 1]],
+        # in their original order
+        self._order = np.argsort(codes, kind='stable').astype(np.int64 if len(codes) > np.iinfo(np.int32).max else np.int32)
+        self._bounds = np.searchsorted(codes[self._order], np.arange(-1, len(self.categories) + 1))[1:]
+
+        self._paths = [split_code(code) for code in self.categories]
+        self._nodes = {}
+        first_seen = {}
+        for i, path in enumerate(self._paths):
+            start, stop = self._bounds[i], self._bounds[i + 1]
+            if start == stop:
+                # Category declared by the dtype but absent from these rows
+                continue
+            first_row = self._order[start]
+            for depth in range(len(path) + 1):
+                node = path[:depth]
+                self._nodes.setdefault(node, []).append(i)
+                first_seen[node] = min(first_seen.get(node, first_row), first_row)
+
+        # Children are listed in order of first appearance, like Series.unique()
+        self._children = {}
+        for node in sorted(self._nodes, key=first_seen.get):
+            if node:
+                self._children.setdefault(node[:-1], []).append(node[-1])
+
+    @classmethod
+    def from_series(cls, series):
+        """Build the index from a ``category_code`` column (categorical or not)."""
+        if not isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.astype('category')
+        return cls(series.cat.codes.to_numpy(), series.cat.categories.astype(str))
+
+    @property
+    def nbytes(self):
+        """Memory held by the row grouping."""
+        return self._order.nbytes + self._bounds.nbytes
+
+    def children(self, *path):
+        """Names of the sub-categories directly below ``path``."""
+        return list(self._children.get(tuple(path), []))
+
+    def rows(self, *path):
+        """Sorted row positions of every event at or below ``path``."""
+        chunks = [self._order[self._bounds[i]:self._bounds[i + 1]] for i in self._nodes.get(tuple(path), [])]
+        if not chunks:
+            return np.empty(0, dtype=self._order.dtype)
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.sort(np.concatenate(chunks))
+
+    def select(self, data, *path):
+        """Rows of ``data`` (the frame the index was built from) under ``path``."""
+        return data.iloc[self.rows(*path)]
+
+    def _as_indexed(self, series):
+        if not isinstance(series.dtype, pd.CategoricalDtype) or not series.cat.categories.equals(self.categories):
+            series = pd.Series(pd.Categorical(series, categories=self.categories), index=series.index, name=series.name)
+        return series.cat.codes.to_numpy()
+
+    def _recode(self, series, labels):
+        """Map each category of ``series`` to ``labels[i]`` (None -> missing)."""
+        names = sorted({label for label in labels if label is not None})
+        lookup = {name: i for i, name in enumerate(names)}
+        # Trailing -1 so that missing codes (-1) stay missing after the lookup
+        table = np.array([lookup[label] if label is not None else -1 for label in labels] + [-1])
+        codes = table[self._as_indexed(series)]
+        return pd.Categorical.from_codes(codes, names)
+
+    def leaf(self, series):
+        """Map a ``category_code`` column to its deepest level, as a categorical."""
+        labels = [path[-1] for path in self._paths]
+        return pd.Series(self._recode(series, labels), index=series.index, name=series.name)
+
@@ -0,0 +1,118 @@
+"""Plotly figure builders that keep browser payloads within a budget.
+
+``st.plotly_chart`` serializes every figure to JSON and ships it to the
+browser.  A treemap with one leaf per (category, brand) pair, or a line chart
+with a point per day of a long export, can run to megabytes and freeze the
+page.  The builders here bound the number of marks instead: the treemap tail
+is collapsed into an "Other" leaf per parent, long series are downsampled
+with Largest-Triangle-Three-Buckets (which keeps the peaks and dips plain
+striding would drop), and line charts with many points render with WebGL.
+"""
+import collections
+
+import numpy as np
+import plotly.express as px
+
+
+# Serialized size above which a figure is reported as over budget, in bytes
+PAYLOAD_BUDGET = 1 << 20
+
+# Points kept per line chart and leaves per treemap
+MAX_POINTS = 1000
+MAX_LEAVES = 500
+
+# Line charts with more points than this are drawn with WebGL
+WEBGL_POINTS = 1000
+
+OTHER = 'Other'
+
+
+def payload_size(fig):
+    """Serialized size of ``fig`` in bytes, as sent to the browser."""
+    return len(fig.to_json())
+
+
+def lttb(x, y, threshold):
+    """Positions of at most ``threshold`` points of ``(x, y)``, chosen by LTTB.
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the point kept
+    before it and the average of the next bucket.
+    """
+    size = len(y)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # Bucket boundaries over the points between the first and the last
+    bounds = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, size - 1
+    for bucket in range(threshold - 2):
+        start, stop = bounds[bucket], bounds[bucket + 1]
+        following = slice(stop, bounds[bucket + 2]) if bucket + 2 < len(bounds) else slice(size - 1, size)
+        next_x, next_y = x[following].mean(), y[following].mean()
+        previous = kept[bucket]
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        kept[bucket + 1] = start + int(np.argmax(areas))
+    return kept
+
+
+def downsample(frame, x, columns, max_points=MAX_POINTS):
+    """Rows of ``frame`` keeping the shape of every series in ``columns``.
+
+    Each column is downsampled on its own and the kept rows are combined, so
+    at most ``max_points`` rows remain.
+    """
+    if len(frame) <= max_points:
+        return frame
+    positions = frame[x].to_numpy()
+    if np.issubdtype(positions.dtype, np.datetime64):
+        positions = positions.view('int64')
+    threshold = max(max_points // len(columns), 3)
+    kept = np.unique(np.concatenate([lttb(positions, frame[column].to_numpy(), threshold) for column in columns]))
+    return frame.iloc[kept]
+
+
+def collapse_tail(frame, path, values, max_leaves=MAX_LEAVES, other=OTHER):
+    """Keep the ``max_leaves`` largest leaves; sum the rest into ``other`` per parent."""
+    frame = frame.groupby(path, observed=True, sort=False)[values].sum().reset_index()
+    if len(frame) <= max_leaves:
+        return frame
+    tail = frame[values].rank(method='first', ascending=False) > max_leaves
+    frame[path[-1]] = frame[path[-1]].astype(object).where(~tail, other)
+    # Regrouped so a real leaf called ``other`` merges with the tail
+    return frame.groupby(path, sort=False)[values].sum().reset_index()
+
+
+def line(frame, x, y, max_points=MAX_POINTS, **kwargs):
+    """``px.line`` over at most ``max_points`` rows, in WebGL when large."""
+    columns = [y] if isinstance(y, str) else list(y)
+    frame = downsample(frame, x, columns, max_points)
+    render_mode = 'webgl' if len(frame) * len(columns) > WEBGL_POINTS else 'auto'
+    return px.line(frame, x=x, y=y, render_mode=render_mode, **kwargs)
+
+
+def treemap(frame, path, values, max_leaves=MAX_LEAVES, **kwargs):
+    """``px.treemap`` with at most ``max_leaves`` leaves plus one "Other" per parent."""
+    return px.treemap(collapse_tail(frame, path, values, max_leaves), path=path, values=values, **kwargs)
+
+
+class Sized(collections.namedtuple('Sized', ['fig', 'report'])):
+    """A figure with the report of its payload.
+
+    ``nbytes`` is the payload size already measured, so memoizing the pair
+    does not serialize the figure a second time.
+    """
+
+    @property
+    def nbytes(self):
+        return self.report['bytes']
+
+
+def sized(fig, budget=PAYLOAD_BUDGET):
+    """``(fig, report)`` where ``report`` holds its payload size and budget status."""
+    size = payload_size(fig)
+    return Sized(fig, {'bytes': size, 'over_budget': size > budget})
@@ -0,0 +1,172 @@
+"""View -> cart -> purchase funnels over browsing sessions.
+
+A funnel follows each product within a session (a ``user_session`` and
+``product_id`` pair): it enters with the first view, converts to cart with
+the first cart event at or after that view, and to purchase with the first
+purchase at or after that cart.  Grouping tens of millions of raw events by
+pair in pandas is far too slow for a rerun, so the events are sorted once on
+a combined (session, product) integer key and the first time of every step
+is taken per run of equal keys with ``np.minimum.reduceat``.
+
+The pairs are then reduced to step counts per (category_code, brand) cell,
+plus the times to convert of the (few) pairs that reached the cart.  Any
+category path and breakdown is a small groupby over those two tables.
+"""
+import numpy as np
+import pandas as pd
+
+from techtrackr.categories import CategoryIndex
+
+
+FUNNEL_STEPS = ['view', 'cart', 'purchase']
+
+# Raw event columns a funnel is built from
+COLUMNS = ['event_time', 'event_type', 'product_id', 'category_code', 'brand', 'user_session']
+
+# Columns of the conversion tables
+STEP_COUNTS = ['views', 'carts', 'purchases']
+MEDIANS = ['median_time_to_cart', 'median_time_to_purchase']
+
+_NEVER = np.iinfo(np.int64).max
+
+
+def first_steps(session, product, event_type, event_time):
+    """First view, cart and purchase time of every (session, product) pair.
+
+    Arguments are aligned arrays: session codes (negative for none), product
+    ids, event type codes in :data:`FUNNEL_STEPS` order and int64 times.
+    Returns ``(rows, times)``: a row position of each pair (for its product's
+    attributes) and a (pairs, 3) array of step times, ``_NEVER`` where the
+    pair did not reach a step.  Carts only count at or after the first view,
+    and purchases at or after the first such cart.
+    """
+    rows = np.flatnonzero(np.asarray(session) >= 0)
+    products, _ = pd.factorize(np.asarray(product)[rows])
+    key = (np.asarray(session)[rows].astype(np.int64) << 32) | products
+    # One sort groups every pair's rows; their order in time does not
+    # matter since the steps only take minimums
+    order = np.argsort(key)
+    rows, key = rows[order], key[order]
+    new_pair = np.empty(len(key), dtype=bool)
+    new_pair[:1] = True
+    np.not_equal(key[1:], key[:-1], out=new_pair[1:])
+    starts = np.flatnonzero(new_pair)
+    pair = np.cumsum(new_pair) - 1
+
+    time = np.asarray(event_time)[rows]
+    step = np.asarray(event_type)[rows]
+    times = np.full((len(starts), len(FUNNEL_STEPS)), _NEVER, dtype=np.int64)
+    reached = np.zeros(len(rows), dtype=np.int64)
+    for number in range(len(FUNNEL_STEPS)):
+        # Step times of the rows that can count, the rest never do
+        eligible = step == number
+        if number:
+            eligible &= time >= reached
+        if len(starts):
+            times[:, number] = np.minimum.reduceat(np.where(eligible, time, _NEVER), starts)
+        reached = times[pair, number]
+    return rows[starts], times
+
+
+class Funnel:
+    """Funnel step counts and times to convert, by category and brand.
+
+    ``steps`` has one row per (category_code, brand) with the number of
+    pairs that reached each step (``views``, ``carts``, ``purchases``);
+    ``durations`` one row per pair that reached the cart, with seconds from
+    view to cart and to purchase (NaN when not purchased).  Build it from
+    the shared raw events with :meth:`from_events`, or from a loaded frame
+    of :data:`COLUMNS` with :meth:`from_frame`.
+    """
+
+    def __init__(self, steps, durations):
+        self.steps = steps
+        self.durations = durations
+        self._steps_index = CategoryIndex.from_series(steps['category_code'])
+        self._durations_index = CategoryIndex.from_series(durations['category_code'])
+
+    @classmethod
+    def from_events(cls, events):
+        """Funnels of a :class:`~techtrackr.shared.SharedEvents`, read from its mapped columns."""
+        return cls._build(events.codes, events.categories, events.column)
+
+    @classmethod
+    def from_frame(cls, data):
+        """Funnels of loaded events, e.g. from :meth:`~techtrackr.store.EventStore.load`."""
+        return cls._build(lambda name: data[name].cat.codes.to_numpy(), lambda name: data[name].cat.categories,
+                          data.__getitem__)
+
+    @classmethod
+    def _build(cls, codes, categories, column):
+        # Event type codes in FUNNEL_STEPS order; the trailing -1 keeps missing codes missing
+        recode = np.append(pd.Index(FUNNEL_STEPS).get_indexer(categories('event_type')), -1)
+        event_time = column('event_time')
+        if event_time.dt.tz is not None:
+            event_time = event_time.dt.tz_convert(None)
+        rows, times = first_steps(
+            codes('user_session'),
+            column('product_id').to_numpy(),
+            recode[codes('event_type')],
+            event_time.to_numpy().astype('datetime64[s]').view(np.int64),
+        )
+        viewed = times[:, 0] != _NEVER
+        rows, times = rows[viewed], times[viewed]
+        category, brand = codes('category_code')[rows], codes('brand')[rows]
+        categories, brands = categories('category_code'), categories('brand')
+
+        # Pairs per (category, brand) cell; +1 keeps missing (-1) codes apart
+        size = (len(categories) + 1) * (len(brands) + 1)
+        cell = (category.astype(np.int64) + 1) * (len(brands) + 1) + brand + 1
+        counts = {name: np.bincount(cell[times[:, number] != _NEVER], minlength=size)
+                  for number, name in enumerate(STEP_COUNTS)}
+        cells = np.flatnonzero(counts['views'])
+        steps = pd.DataFrame({
+            'category_code': pd.Categorical.from_codes(cells // (len(brands) + 1) - 1, categories),
+            'brand': pd.Categorical.from_codes(cells % (len(brands) + 1) - 1, brands),
+            **{name: values[cells] for name, values in counts.items()},
+        })
+
+        carted = times[:, 1] != _NEVER
+        seconds = times[carted] - times[carted, :1]
+        durations = pd.DataFrame({
+            'category_code': pd.Categorical.from_codes(category[carted], categories),
+            'brand': pd.Categorical.from_codes(brand[carted], brands),
+            'to_cart': seconds[:, 1].astype(np.float32),
+            'to_purchase': np.where(times[carted, 2] != _NEVER, seconds[:, 2], np.nan).astype(np.float32),
+        })
+        return cls(steps, durations)
+
+    @property
+    def nbytes(self):
+        """Memory held by the step counts and times to convert."""
+        return int(self.steps.memory_usage(deep=True).sum() + self.durations.memory_usage(deep=True).sum())
+
+    def conversion(self, *path, by=None):
+        """Step counts, conversion rates and median times to convert under ``path``.
+
+        One row per value of ``by`` ('brand', 'category_code' or 'category'
+        for the leaf category), most viewed first; a single row labelled
+        'All' when ``by`` is None.  ``cart_rate`` is carts per view,
+        ``purchase_rate`` purchases per cart and ``conversion_rate``
+        purchases per view; median times are in seconds.
+        """
+        steps = self._steps_index.select(self.steps, *path)
+        durations = self._durations_index.select(self.durations, *path)
+        if by is None:
+            table = steps[STEP_COUNTS].sum().to_frame('All').T
+            medians = durations[['to_cart', 'to_purchase']].median().to_frame('All').T
+        else:
+            if by == 'category':
+                keys = [self._steps_index.leaf(steps['category_code']), self._durations_index.leaf(durations['category_code'])]
+            else:
+                keys = [steps[by], durations[by]]
+            table = steps.groupby(keys[0], observed=True)[STEP_COUNTS].sum()
+            medians = durations.groupby(keys[1], observed=True)[['to_cart', 'to_purchase']].median()
+            table.index.name = by
+
+        table[MEDIANS] = medians.reindex(table.index).to_numpy(dtype=np.float64)
+        views = table['views'].where(table['views'] > 0)
+        table.insert(3, 'cart_rate', table['carts'] / views)
+        table.insert(4, 'purchase_rate', table['purchases'] / table['carts'].where(table['carts'] > 0))
+        table.insert(5, 'conversion_rate', table['purchases'] / views)
+        return table.sort_values('views', ascending=False, kind='stable')
@@ -0,0 +1,206 @@
+"""Timers, peak memory and row counts for the stages of a page run.
+
+A :class:`Profile` records one script run (or one fragment rerun) of a page
+as a list of stages.  Each stage has its wall time, the rows it produced and
+its peak memory.  Peak memory comes from ``tracemalloc`` when it is tracing,
+e.g. after :func:`trace_memory`, since tracing slows every allocation.
+Otherwise the process's peak RSS so far is recorded.  Finished runs are
+appended as JSON lines to a log, which :func:`latency_percentiles`
+summarizes into p50/p95 latencies::
+
+    python -m techtrackr.instrument techtrackr-metrics.jsonl
+"""
+import contextlib
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Where runs are logged unless a Profile is given another path; '' disables
+METRICS_LOG = os.environ.get('TECHTRACKR_METRICS_LOG', 'techtrackr-metrics.jsonl')
+
+_log_lock = threading.Lock()
+
+
+def trace_memory():
+    """Start ``tracemalloc`` so stages record their own peak memory."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def row_count(value):
+    """Rows of a frame or series result, None for anything else."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return len(value)
+    return None
+
+
+class Profile:
+    """Stages of one run of ``page``, emitted as a JSON line by :meth:`finish`.
+
+    Stages nest; an outer stage's peak memory covers its inner stages.
+    :meth:`section` marks a part of the page that may later rerun on its
+    own, as a Streamlit fragment does after the full run finished.
+    ``tags`` (e.g. a commit or dataset size) are logged with every run.
+    """
+
+    def __init__(self, page, log_path=None, tags=None):
+        self.page = page
+        self.log_path = METRICS_LOG if log_path is None else log_path
+        self.tags = tags or {}
+        self.finished = False
+        self._start(page)
+
+    def _start(self, run):
+        self.run = run
+        self.stages = []
+        self.started = time.time()
+        self._clock = time.perf_counter()
+        self._peaks = []
+        self.finished = False
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """Time the body as stage ``name``.
+
+        Yields the stage's record, where the body can set ``rows`` and
+        ``cached`` (whether the result came from a cache).
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        record = {'stage': name, 'seconds': None, 'rows': rows, 'peak_bytes': None, 'cached': None, 'depth': len(self._peaks)}
+        self.stages.append(record)
+        self._peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            peak = self._peaks.pop()
+            if tracing:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                record['peak_bytes'] = peak
+            else:
+                record['peak_bytes'] = _max_rss()
+
+    @contextlib.contextmanager
+    def section(self, name):
+        """A stage, or a run of its own when the page run already finished."""
+        if not self.finished:
+            with self.stage(name) as record:
+                yield record
+            return
+        self._start(f'{self.page}.{name}')
+        try:
+            with self.stage(name) as record:
+                yield record
+        finally:
+            self.finish()
+
+    def finish(self):
+        """Close the run and append it to the log; returns the logged record."""
+        record = {
+            'time': datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(),
+            'run': self.run,
+            'seconds': time.perf_counter() - self._clock,
+            'memory': 'traced' if tracemalloc.is_tracing() else 'max_rss',
+            'stages': self.stages,
+        }
+        if self.tags:
+            record['tags'] = self.tags
+        self.finished = True
+        if self.log_path:
+            line = json.dumps(record) + '\n'
+            with _log_lock, open(self.log_path, 'a') as file:
+                file.write(line)
+        return record
+
+    def frame(self):
+        """Stages recorded so far as a DataFrame, indented by depth."""
+        frame = pd.DataFrame(self.stages, columns=['stage', 'seconds', 'rows', 'peak_bytes', 'cached', 'depth'])
+        frame['stage'] = ['  ' * depth + stage for stage, depth in zip(frame['stage'], frame['depth'])]
+        return frame.drop(columns='depth').set_index('stage')
+
+
+class ProfiledMemo:
+    """A memo whose lookups are timed as stages of ``profile``.
+
+    Keys are laid out as by :class:`~techtrackr.analytics.Analytics`,
+    ``(version, path, name, *arguments)``; stages are named after ``name``
+    and record whether the value was cached.
+    """
+
+    def __init__(self, memo, profile):
+        self.memo = memo
+        self.profile = profile
+
+    def get(self, key, compute):
+        with self.profile.stage(key[2]) as record:
+            def timed_compute():
+                record['cached'] = False
+                return compute()
+
+            record['cached'] = True
+            value = self.memo.get(key, timed_compute)
+            record['rows'] = row_count(value)
+        return value
+
+
+def read_log(path=METRICS_LOG):
+    """Logged runs as one row per stage, with the run's own total as stage ''.
+
+    Stage fields other than the timing (rows, peak_bytes, ...) and run tags
+    become columns of their own.
+    """
+    rows = []
+    with open(path, 'r') as file:
+        for line in file:
+            record = json.loads(line)
+            run = {'time': record['time'], 'run': record['run'], **record.get('tags', {})}
+            rows.append({**run, 'stage': '', 'seconds': record['seconds']})
+            rows.extend({**run, **stage} for stage in record['stages'])
+    return pd.DataFrame(rows, columns=None if rows else ['time', 'run', 'stage', 'seconds'])
+
+
+def latency_percentiles(path=METRICS_LOG, freq=None):
+    """p50/p95/max seconds per run and stage, per period of ``freq`` if given (e.g. 'D')."""
+    log = read_log(path)
+    keys = ['run', 'stage']
+    if freq is not None:
+        keys.insert(0, pd.to_datetime(log['time'], utc=True).dt.floor(freq).rename('period'))
+    grouped = log.groupby(keys)['seconds']
+    return pd.DataFrame({
+        'runs': grouped.size(),
+        'p50': grouped.quantile(0.5),
+        'p95': grouped.quantile(0.95),
+        'max': grouped.max(),
+    })
+
+
+if __name__ == '__main__':
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(latency_percentiles(*sys.argv[1:2]))
@@ -0,0 +1,103 @@
+"""Size-bounded LRU memo for per-selection aggregates and figures.
+
+A Dashboard rerun recomputes every aggregate and figure even when only one
+widget changed.  Results are memoized under keys built from the dataset
+version and the part of the selection they depend on, so switching back and
+forth between common selections is a dictionary lookup.  One memo is shared
+by every session of the process; entries must be treated as read-only.
+"""
+import collections
+import sys
+import threading
+
+import pandas as pd
+
+
+def estimate_size(value):
+    """Approximate memory held by a memoized value, in bytes."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    # Values that know their size, e.g. arrays or figures with a measured payload
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if hasattr(value, 'to_plotly_json'):
+        # Plotly figures: what gets serialized to the browser
+        return len(value.to_json())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUMemo:
+    """Thread-safe LRU cache bounded by entry count and estimated bytes.
+
+    ``get(key, compute)`` returns the cached value for ``key`` or stores
+    ``compute()``.  Hits, misses and evictions are counted for monitoring.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=256 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Computed outside the lock so slow entries do not block other
+        # sessions; a concurrent miss on the same key just computes twice
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """Store ``value`` under ``key`` as the most recently used entry."""
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if size <= self.max_bytes:
+                self._entries[key] = (value, size)
+                self.bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def items(self):
+        """Snapshot of the ``(key, value)`` entries, least recently used first."""
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._entries.items()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Counters as a dict, e.g. for a debug panel."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,118 @@
+"""Pluggable execution backends for the aggregation workloads.
+
+Building the rollup cube is dominated by CSV parsing and groupbys, which a
+single Streamlit script thread runs on one core.  The work is split into
+independent tasks (byte ranges of an export, aligned to line boundaries, or
+whole partition files), mapped over a backend, and the partial results are
+merged by the caller.  :class:`SerialBackend` runs tasks inline;
+:class:`PoolBackend` fans them out to a process (or thread) pool.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+
+
+# Target size of one task when an export is split into byte ranges
+RANGE_BYTES = 64 << 20
+
+
+class SerialBackend:
+    """Run every task in the calling thread."""
+
+    workers = 1
+
+    def map(self, function, tasks):
+        """Yield ``function(*task)`` for every task, in order."""
+        for task in tasks:
+            yield function(*task)
+
+
+class PoolBackend:
+    """Run tasks on a pool of ``workers`` processes (or threads).
+
+    Results are yielded as tasks complete, so callers must merge them in an
+    order-independent way.  ``function`` must be importable (module level)
+    for the process pool.  Worker processes are spawned rather than forked,
+    since the Streamlit server that creates them is multithreaded.  The pool
+    is started on first use and kept until :meth:`close`, so later calls do
+    not pay for spawning workers again.
+    """
+
+    def __init__(self, workers=None, kind='process'):
+        self.workers = workers or os.cpu_count() or 1
+        if kind not in ('process', 'thread'):
+            raise ValueError(f"Unknown pool kind: {kind!r}")
+        self.kind = kind
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                if self.kind == 'thread':
+                    self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+                else:
+                    self._pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def map(self, function, tasks):
+        """Yield ``function(*task)`` for every task, as each completes."""
+        futures = [self._executor().submit(function, *task) for task in tasks]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        except concurrent.futures.BrokenExecutor:
+            # A worker died; start a fresh pool next time
+            self.close()
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        """Shut the pool down; it is started again if needed."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def get_backend(workers=None, kind='process'):
+    """Backend for ``workers`` workers; None means one per CPU, 1 is serial."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        return SerialBackend()
+    return PoolBackend(workers, kind)
+
+
+def split_ranges(path, start, stop, parts):
+    """Split bytes ``[start, stop)`` of a text file into up to ``parts`` ranges.
+
+    Every range but the first starts right after a newline, so each can be
+    parsed on its own.
+    """
+    bounds = [start]
+    with open(path, 'rb') as file:
+        for part in range(1, parts):
+            file.seek(start + (stop - start) * part // parts)
+            file.readline()
+            position = file.tell()
+            if bounds[-1] < position < stop:
+                bounds.append(position)
+    bounds.append(stop)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def range_count(size, workers, range_bytes=RANGE_BYTES):
+    """Number of ranges to split ``size`` bytes into for ``workers`` workers.
+
+    A single range up to ``range_bytes``, where splitting costs more than it
+    saves.  Beyond that at least one per worker, and small enough that
+    progress can be reported and a slow range does not leave the other
+    workers idle.
+    """
+    if size <= range_bytes:
+        return 1
+    return max(workers, -(-size // range_bytes))
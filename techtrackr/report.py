@@ -0,0 +1,82 @@
+"""Batch precomputation and reports, e.g. from a nightly cron job.
+
+    python -m techtrackr.report events.csv --output reports --workers 0
+    python -m techtrackr.report events.csv --warm 20
+
+Folds the source into the persisted rollup cube and builds the shared
+memory-mapped events, so a Dashboard starting afterwards only loads them
+instead of parsing the export.  Then writes every table of
+:data:`~techtrackr.analytics.REPORTS` for every category path, one CSV per
+table with the path in a ``category_path`` column, and/or persists the
+aggregates of the most used selections for Dashboards to restore at start
+(see :mod:`techtrackr.warmup`).
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from techtrackr.analytics import REPORTS, Analytics
+from techtrackr.categories import DEPTH
+from techtrackr.ingest import DEFAULT_CACHE_DIR
+from techtrackr.parallel import get_backend
+from techtrackr.rollup import RollupCube
+from techtrackr.shared import SharedEvents
+from techtrackr.usage import USAGE_DB
+from techtrackr.warmup import warm_up
+
+
+def precompute(source, cache_dir=DEFAULT_CACHE_DIR, workers=1, progress=None):
+    """Bring the persisted cube and shared events of ``source`` up to date."""
+    cube = RollupCube(source, cache_dir=cache_dir, backend=get_backend(workers)).refresh(progress)
+    events = SharedEvents.open(source, cache_dir)
+    return Analytics(cube, events=lambda: events)
+
+
+def write_reports(core, output, depth=DEPTH):
+    """Write the report tables of every category path down to ``depth`` levels."""
+    os.makedirs(output, exist_ok=True)
+    tables = {name: [] for name in REPORTS}
+    for path in core.category_paths(depth):
+        for name, table in core.report(*path).items():
+            tables[name].append(table.assign(category_path='.'.join(path)))
+
+    paths = []
+    for name, frames in tables.items():
+        path = os.path.join(output, f'{name}.csv')
+        table = pd.concat(frames, ignore_index=True)
+        columns = ['category_path'] + [column for column in table.columns if column != 'category_path']
+        table[columns].to_csv(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', nargs='?', default='events.csv', help="events export or directory of partitions")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=1, help="processes building the cube; 0 means one per CPU")
+    parser.add_argument('--output', help="directory to write report CSVs to; only precomputes without it")
+    parser.add_argument('--depth', type=int, default=DEPTH, help="deepest category level to report on")
+    parser.add_argument('--warm', type=int, metavar='N', help="persist the aggregates of the N most used category selections")
+    parser.add_argument('--usage', default=USAGE_DB, help="usage store, or counters JSON, ranking selections by use")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    core = precompute(args.source, args.cache_dir, args.workers)
+    print(f"Precomputed {int(core.cube.table['count'].sum()):,} events in {time.perf_counter() - start:.1f}s")
+    if args.output:
+        start = time.perf_counter()
+        for path in write_reports(core, args.output, args.depth):
+            print(f"Wrote {path}")
+        print(f"Reports in {time.perf_counter() - start:.1f}s")
+    if args.warm:
+        start = time.perf_counter()
+        selections, entries = warm_up(core.cube, args.usage, args.warm)
+        print(f"Warmed {len(selections)} selections ({entries} aggregates) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
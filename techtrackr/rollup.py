@@ -0,0 +1,370 @@
+"""Pre-aggregated rollup cube behind the Dashboard charts.
+
+Every chart on the Dashboard page is a count (or price average) over some of
+date, hour, event type, category and brand.  The cube stores event counts and
+price sums at exactly that grain, so a widget is answered from a few thousand
+cube rows instead of the raw events.
+
+The cube is built out of core: events.csv (or a directory of daily partition
+files) is streamed in chunks and each chunk is folded into the cube, so
+memory is bounded by the chunk size and the cube itself, never by the input.
+It is persisted next to the Parquet cache and refreshed incrementally: rows
+appended to a partition since the last build are read from the stored byte
+offset, and new partitions are read in full.  Reading is split into byte
+ranges mapped over a :mod:`techtrackr.parallel` backend, so the first build
+can use every core.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from techtrackr.categories import CategoryIndex
+from techtrackr.ingest import (DEFAULT_CACHE_DIR, DEFAULT_CHUNKSIZE, complete_length, iter_events_csv,
+                               list_partitions, parse_event_time, time_features)
+from techtrackr.parallel import RANGE_BYTES, SerialBackend, range_count, split_ranges
+from techtrackr.timeseries import event_time_series
+from techtrackr.topk import Rankings
+
+
+GRAIN = ['event_date', 'event_hour', 'event_type', 'category_code', 'brand']
+MEASURES = ['count', 'price_sum', 'price_count']
+CATEGORICAL_KEYS = ['event_type', 'category_code', 'brand']
+
+# Leading bytes hashed to tell an append from a rewritten file
+HEAD_BYTES = 1 << 16
+
+# Bumped whenever the persisted cube layout changes
+CUBE_VERSION = 4
+
+
+def aggregate(frame):
+    """Roll raw events up to the cube grain."""
+    if 'event_date' in frame.columns:
+        # Loaded through techtrackr.ingest, which already derived the features
+        features = frame
+    else:
+        event_time = frame['event_time']
+        if not pd.api.types.is_datetime64_any_dtype(event_time):
+            event_time = parse_event_time(event_time)
+        features = time_features(event_time)
+
+    keys = pd.DataFrame({
+        'event_date': features['event_date'],
+        'event_hour': features['event_hour'],
+        'event_type': frame['event_type'],
+        'category_code': frame['category_code'],
+        'brand': frame['brand'],
+        'price': frame['price'].astype('float64'),
+    })
+    table = keys.groupby(GRAIN, observed=True, dropna=False, sort=False)['price'].agg(['size', 'sum', 'count'])
+    table.columns = MEASURES
+    return table.reset_index()
+
+
+def combine(tables):
+    """Merge partial cube tables, summing the measures of matching cells."""
+    tables = [table for table in tables if len(table)]
+    if not tables:
+        return _empty_table()
+    if len(tables) == 1:
+        return tables[0]
+
+    # Align the categories of every key so concat keeps the compact dtype
+    for key in CATEGORICAL_KEYS:
+        columns = [table[key].astype('category') for table in tables]
+        categories = union_categoricals(columns, ignore_order=True).categories
+        tables = [table.assign(**{key: column.cat.set_categories(categories)})
+                  for table, column in zip(tables, columns)]
+
+    table = pd.concat(tables, ignore_index=True)
+    return table.groupby(GRAIN, observed=True, dropna=False, sort=False)[MEASURES].sum().reset_index()
+
+
+def _empty_table():
+    return pd.DataFrame({
+        'event_date': pd.Series(dtype='datetime64[ns]'),
+        'event_hour': pd.Series(dtype='int8'),
+        **{key: pd.Series(dtype='category') for key in CATEGORICAL_KEYS},
+        'count': pd.Series(dtype='int64'),
+        'price_sum': pd.Series(dtype='float64'),
+        'price_count': pd.Series(dtype='int64'),
+    })
+
+
+def _head_digest(path, length):
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read(length)).hexdigest()
+
+
+def _continues_line(path, offset):
+    """Whether bytes appended at ``offset`` extend a line left unterminated there."""
+    if offset == 0:
+        return False
+    with open(path, 'rb') as file:
+        file.seek(offset - 1)
+        boundary = file.read(2)
+    return boundary[:1] != b'\n' and boundary[1:] not in (b'\n', b'\r')
+
+
+def _negated(table):
+    """A partial cube table that takes ``table``'s rows back out when combined."""
+    return table.assign(**{measure: -table[measure] for measure in MEASURES})
+
+
+def aggregate_range(path, start, stop, chunksize=DEFAULT_CHUNKSIZE):
+    """Aggregate the rows stored in bytes ``[start, stop)`` of ``path``.
+
+    Chunks are folded into the partial cube as they are read, so memory is
+    bounded by ``chunksize``.  Returns the partial cube table and the number
+    of bytes covered.  Module level so process pools can run it.
+    """
+    table = _empty_table()
+    for chunk, _ in iter_events_csv(path, start, stop, chunksize):
+        table = combine([table, aggregate(chunk)])
+    return table, stop - start
+
+
+class RollupCube:
+    """Counts and price sums at the ``GRAIN`` of the dashboard charts.
+
+    ``source`` is an events export or a directory of partition files.  The
+    cube is empty until the first :meth:`refresh`, which loads the persisted
+    cube (or streams the source) and folds in anything appended since.
+    ``table`` holds one row per (date, hour, event_type, category_code,
+    brand) cell.  Query helpers take an optional category path, as used by
+    :class:`~techtrackr.categories.CategoryIndex`, event type and ``dates``
+    window, a ``(first, last)`` pair of days, both included.
+    """
+
+    def __init__(self, source='events.csv', cache_dir=DEFAULT_CACHE_DIR, chunksize=DEFAULT_CHUNKSIZE, backend=None):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.chunksize = chunksize
+        self.backend = backend or SerialBackend()
+        self.loaded = False
+        # Partition path -> {'offset': bytes folded in, 'size': file size last
+        # seen, 'tail': start of an unterminated last row folded in (or None),
+        # 'settled': whether an unterminated last row was left out for good,
+        # 'head_digest': ...}
+        self.partitions = {}
+        # Bumped whenever the table changes; keys memoized query results
+        self.version = 0
+        self._lock = threading.Lock()
+        self._set(_empty_table())
+
+    @classmethod
+    def from_frame(cls, data):
+        """In-memory cube over already loaded events, not tied to a source."""
+        cube = cls(source=None)
+        cube._set(aggregate(data))
+        cube.loaded = True
+        return cube
+
+    def _set(self, table):
+        # Table and index are swapped together so concurrent readers never
+        # mix a new table with the row positions of the old one
+        self._state = (table, CategoryIndex.from_series(table['category_code']))
+        self.version += 1
+
+    @property
+    def table(self):
+        return self._state[0]
+
+    @property
+    def category_index(self):
+        return self._state[1]
+
+    @property
+    def signature(self):
+        """Digest of the source bytes folded in, stable across restarts."""
+        folded = {path: [known['offset'], known['head_digest']] for path, known in self.partitions.items()}
+        return hashlib.sha1(json.dumps([CUBE_VERSION, folded], sort_keys=True).encode()).hexdigest()
+
+    def _paths(self):
+        stem = os.path.splitext(os.path.basename(os.path.normpath(self.source)))[0]
+        return (os.path.join(self.cache_dir, stem + '.rollup.parquet'),
+                os.path.join(self.cache_dir, stem + '.rollup.json'))
+
+    def _load_saved(self):
+        table_path, meta_path = self._paths()
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            if meta.get('version') != CUBE_VERSION:
+                return
+            table = pd.read_parquet(table_path)
+        except (OSError, ValueError):
+            return
+        self.partitions = meta['partitions']
+        self._set(table)
+
+    def _pending(self):
+        """Partitions with unread bytes, or None when the cube must be rebuilt.
+
+        Returns ``(path, start, size, finished, retract)`` tuples: bytes are
+        read from ``start``, up to ``size`` when the file is ``finished``
+        (unchanged since the last refresh, so its unterminated last row is
+        complete) and up to its last newline otherwise.  ``retract`` is the
+        byte range of a last row folded in earlier that turned out to be
+        still being written, to take back out before it is read again.
+        """
+        files = list_partitions(self.source)
+        if set(self.partitions) - set(files):
+            # A partition disappeared
+            return None
+        pending = []
+        for path in files:
+            size = os.path.getsize(path)
+            known = self.partitions.get(path)
+            if known is None:
+                pending.append((path, 0, size, False, None))
+            elif size != known['size']:
+                if size < known['offset'] or _head_digest(path, min(known['offset'], HEAD_BYTES)) != known['head_digest']:
+                    # Rewritten rather than appended to
+                    return None
+                if known['tail'] is not None and _continues_line(path, known['offset']):
+                    pending.append((path, known['tail'], size, False, (known['tail'], known['offset'])))
+                else:
+                    pending.append((path, known['offset'], size, False, None))
+            elif known['offset'] < size and not known['settled']:
+                pending.append((path, known['offset'], size, True, None))
+        return pending
+
+    def _is_current(self):
+        """Cheap check (one ``stat`` per partition) that nothing was appended."""
+        files = list_partitions(self.source)
+        return len(files) == len(self.partitions) and all(
+            path in self.partitions and os.path.getsize(path) == self.partitions[path]['size']
+            and (self.partitions[path]['offset'] == self.partitions[path]['size'] or self.partitions[path]['settled'])
+            for path in files)
+
+    def refresh(self, progress=None):
+        """Bring the cube up to date with its source.
+
+        The first call loads the persisted cube; after that only rows
+        appended since the last refresh are streamed in.  Rows are read up
+        to the last newline; an unterminated last row waits until a refresh
+        finds the file unchanged.  ``progress`` is called as
+        ``progress(bytes_read, bytes_total)`` while reading.
+        """
+        if self.source is None or (self.loaded and self._is_current()):
+            return self
+        with self._lock:
+            if not self.loaded:
+                self._load_saved()
+                self.loaded = True
+            pending = self._pending()
+            if pending is None:
+                self.partitions = {}
+                self._set(_empty_table())
+                pending = self._pending()
+            if not pending:
+                return self
+
+            partitions = dict(self.partitions)
+            tasks = []
+            # Last rows and retracted rows: a line each, read inline
+            tables = [self.table]
+            for path, offset, size, finished, retract in pending:
+                entry = {'offset': offset, 'size': size, 'tail': None, 'settled': False}
+                if retract is not None:
+                    tables.append(_negated(aggregate_range(path, *retract, self.chunksize)[0]))
+                if finished:
+                    try:
+                        tables.append(aggregate_range(path, offset, size, self.chunksize)[0])
+                        entry.update(offset=size, tail=offset)
+                    except ValueError:
+                        # Not a valid row; left out until more bytes arrive
+                        entry['settled'] = True
+                else:
+                    stop = max(complete_length(path), offset)
+                    if stop > offset:
+                        for start, end in split_ranges(path, offset, stop, range_count(stop - offset, self.backend.workers)):
+                            tasks.append((path, start, end, self.chunksize))
+                    entry['offset'] = stop
+                entry['head_digest'] = _head_digest(path, min(entry['offset'], HEAD_BYTES))
+                partitions[path] = entry
+            if not tasks and len(tables) == 1:
+                # Only an incomplete line was appended: nothing to fold in
+                self.partitions = partitions
+                return self
+
+            total = sum(end - start for _, start, end, _ in tasks)
+            # Small appends are read inline: shipping them to workers would
+            # cost more than parsing them
+            backend = self.backend if total > RANGE_BYTES else SerialBackend()
+            done = 0
+            for table, size in backend.map(aggregate_range, tasks):
+                tables.append(table)
+                done += size
+                if progress is not None and total:
+                    progress(done, total)
+            table = combine(tables)
+            if any(retract is not None for *_, retract in pending):
+                # Cells only the retracted rows had
+                table = table[table['count'] != 0].reset_index(drop=True)
+            self.partitions = partitions
+            self._set(table)
+            self.save()
+        return self
+
+    def save(self):
+        """Persist the cube so restarts only read rows appended since."""
+        if self.source is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        table_path, meta_path = self._paths()
+        self.table.to_parquet(table_path + '.tmp', index=False)
+        os.replace(table_path + '.tmp', table_path)
+        with open(meta_path + '.tmp', 'w') as file:
+            json.dump({'version': CUBE_VERSION, 'partitions': self.partitions}, file)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def slice(self, *path, event_type=None, dates=None):
+        """Cube rows under category ``path``, optionally for one event type and date window."""
+        return self._slice(self._state, path, event_type, dates)
+
+    @staticmethod
+    def _slice(state, path, event_type, dates=None):
+        table, index = state
+        table = index.select(table, *path)
+        if event_type is not None:
+            table = table[table['event_type'] == event_type]
+        if dates is not None:
+            table = table[(table['event_date'] >= pd.Timestamp(dates[0])) & (table['event_date'] <= pd.Timestamp(dates[1]))]
+        return table
+
+    def date_span(self):
+        """First and last day with events, as dates; (None, None) when empty."""
+        days = self.table['event_date']
+        if not len(days):
+            return None, None
+        return days.min().date(), days.max().date()
+
+    def counts(self, by, *path, event_type=None, dates=None):
+        """Event counts grouped by ``by``, largest first."""
+        table = self.slice(*path, event_type=event_type, dates=dates)
+        return table.groupby(by, observed=True)['count'].sum().sort_values(ascending=False, kind='stable')
+
+    def rankings(self, *path, dates=None):
+        """Brand, category code and leaf category rankings per event type under ``path``."""
+        state = self._state
+        table = self._slice(state, path, None, dates)
+        table = table.assign(category=state[1].leaf(table['category_code']))
+        return Rankings(table, ['brand', 'category_code', 'category'], weights='count')
+
+    def time_series(self, *path, dates=None):
+        """Wide (event_date, event_hour) x event type counts under ``path``."""
+        return event_time_series(self.slice(*path, dates=dates), weights='count')
+
+    def event_summary(self, *path, dates=None):
+        """Event count and average price per event type under ``path``."""
+        totals = self.slice(*path, dates=dates).groupby('event_type', observed=True)[MEASURES].sum()
+        return pd.DataFrame({
+            'count': totals['count'],
+            'average_price': totals['price_sum'] / totals['price_count'],
+        })
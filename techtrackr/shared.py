@@ -0,0 +1,248 @@
+"""Read-only raw events shared by every session of a process.
+
+``st.cache_data`` hands each caller its own unpickled copy of a frame, and
+per-session filtering used to materialize further copies.  Here the raw
+events are written once to an uncompressed Arrow IPC file of plain numeric
+columns (categoricals as integer codes, timestamps as int64) and
+memory-mapped.  The source is streamed in chunks, each written as one record
+batch, so building the file never holds all events at once.  Columns are
+read-only NumPy views of the mapping, zero-copy when the file holds a single
+batch (up to ``DEFAULT_CHUNKSIZE`` rows) and otherwise joined once per
+process, so the sessions of a process share one copy.  Sessions filter with
+row-index arrays and gather only the columns they actually need.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+
+from techtrackr.categories import CategoryIndex
+from techtrackr.ingest import (DEFAULT_CACHE_DIR, DEFAULT_CHUNKSIZE, SCHEMA, complete_length, iter_events_csv,
+                               list_partitions, source_signature)
+
+
+# Bumped whenever the shared file layout changes
+SHARED_VERSION = 3
+
+
+def _paths(source, cache_dir):
+    stem = os.path.join(cache_dir, os.path.splitext(os.path.basename(os.path.normpath(source)))[0])
+    return stem + '.arrow', stem + '.categories.arrow', stem + '.arrow.json'
+
+
+def _signatures(source, previous=None):
+    previous = previous or {}
+    return {path: source_signature(path, previous.get(path)) for path in list_partitions(source)}
+
+
+def _arrays(data, categories, layout):
+    """Arrow arrays of one frame, categorical codes recoded into ``categories``."""
+    arrays = {}
+    for name, column in data.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            # Values first seen in this frame extend the column's categories,
+            # so earlier batches keep their codes
+            known = categories.setdefault(name, {})
+            for value in column.cat.categories.astype(str):
+                known.setdefault(value, len(known))
+            recode = np.append(np.fromiter(map(known.__getitem__, column.cat.categories.astype(str)), dtype=np.int32,
+                                           count=len(column.cat.categories)), np.int32(-1))
+            arrays[name] = pa.array(recode[column.cat.codes.to_numpy()])
+            layout[name] = {'kind': 'category'}
+        elif pd.api.types.is_datetime64_any_dtype(column):
+            tz = column.dt.tz
+            values = (column.dt.tz_convert(None) if tz is not None else column).to_numpy()
+            arrays[name] = pa.array(values.view('int64'))
+            layout[name] = {'kind': 'datetime', 'dtype': str(values.dtype), 'tz': str(tz) if tz is not None else None}
+        elif pd.api.types.is_numeric_dtype(column):
+            # NaN stays a value (not an Arrow null) so the column maps zero-copy.
+            # Ids are downcast per chunk, so they keep their full schema width
+            # to give every batch the same type
+            arrays[name] = pa.array(column.to_numpy(dtype=SCHEMA.get(name, column.dtype)))
+            layout[name] = {'kind': 'numeric'}
+    return arrays
+
+
+def write_shared(frames, path, categories_path):
+    """Write event frames as memory-mappable numeric columns; returns their layout.
+
+    ``frames`` is a DataFrame or an iterable of DataFrames with the same
+    columns, each written as one record batch, so only one is held at a time.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    categories, layout = {}, {}
+    tmp_path = path + '.tmp'
+    writer = None
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        for data in frames:
+            batch = pa.record_batch(_arrays(data, categories, layout))
+            if writer is None:
+                writer = pa.ipc.new_file(sink, batch.schema)
+            writer.write_batch(batch)
+        if writer is None:
+            raise ValueError("No events to share")
+        writer.close()
+    os.replace(tmp_path, path)
+
+    category_columns = [name for name, values in categories.items() for _ in values]
+    category_values = [value for values in categories.values() for value in values]
+    tmp_path = categories_path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        table = pa.table({'column': pa.array(category_columns, pa.string()),
+                          'value': pa.array(category_values, pa.string())})
+        with pa.ipc.new_file(sink, table.schema) as category_writer:
+            category_writer.write_table(table)
+    os.replace(tmp_path, categories_path)
+    return layout
+
+
+def iter_source(source, finished=(), held=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Stream every partition of an events source in frames of ``chunksize`` rows.
+
+    Partitions are read up to their last newline, since a line after it may
+    still be being written.  The unterminated last row of a partition in
+    ``finished`` (known to have stopped growing) is read too, unless it is
+    not a valid row; other partitions with such a row are appended to
+    ``held``.
+    """
+    for path in list_partitions(source):
+        stop = complete_length(path)
+        for chunk, _ in iter_events_csv(path, stop=stop, chunksize=chunksize):
+            yield chunk
+        size = os.path.getsize(path)
+        if stop == size:
+            continue
+        if path not in finished:
+            if held is not None:
+                held.append(path)
+            continue
+        try:
+            tail = [chunk for chunk, _ in iter_events_csv(path, stop, size, chunksize)]
+        except ValueError:
+            continue
+        yield from tail
+
+
+class SharedEvents:
+    """Immutable event columns memory-mapped from an Arrow IPC file.
+
+    Use :meth:`open` to get an instance for an events source, building the
+    shared file first if the source changed.  Row selections are plain index
+    arrays from :meth:`rows`; :meth:`column` and :meth:`frame` gather only
+    the selected rows of the requested columns.
+    """
+
+    def __init__(self, path, categories_path, layout):
+        self._map = pa.memory_map(path, 'r')
+        table = pa.ipc.open_file(self._map).read_all()
+        self._layout = layout
+        self._arrays = {}
+        for name in layout:
+            chunks = [chunk.to_numpy(zero_copy_only=True) for chunk in table.column(name).chunks]
+            if len(chunks) == 1:
+                self._arrays[name] = chunks[0]
+            elif chunks:
+                # Written in several batches: joined once per process
+                self._arrays[name] = np.concatenate(chunks)
+            else:
+                self._arrays[name] = np.empty(0, dtype=table.schema.field(name).type.to_pandas_dtype())
+
+        categories = pa.ipc.open_file(pa.memory_map(categories_path, 'r')).read_pandas()
+        self._dtypes = {}
+        for name, values in categories.groupby('column', sort=False)['value']:
+            self._dtypes[name] = pd.CategoricalDtype(pd.Index(values.to_numpy(), dtype=str))
+        for name, spec in layout.items():
+            if spec['kind'] == 'category':
+                self._dtypes.setdefault(name, pd.CategoricalDtype(pd.Index([], dtype=str)))
+
+        self._lock = threading.Lock()
+        self._category_index = None
+
+    @classmethod
+    def open(cls, source='events.csv', cache_dir=DEFAULT_CACHE_DIR):
+        """Map the shared file of ``source``, (re)building it when stale."""
+        path, categories_path, meta_path = _paths(source, cache_dir)
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            meta = {}
+        signatures = _signatures(source, meta.get('sources'))
+        # Partitions whose unterminated last row was left out and that have
+        # not changed since: that row is complete now
+        finished = {held for held in meta.get('held', []) if meta['sources'].get(held) == signatures.get(held)}
+        if meta.get('version') != SHARED_VERSION or meta.get('sources') != signatures or finished:
+            os.makedirs(cache_dir, exist_ok=True)
+            held = []
+            layout = write_shared(iter_source(source, finished, held), path, categories_path)
+            meta = {'version': SHARED_VERSION, 'sources': signatures, 'held': held, 'layout': layout}
+            with open(meta_path + '.tmp', 'w') as file:
+                json.dump(meta, file)
+            os.replace(meta_path + '.tmp', meta_path)
+        return cls(path, categories_path, meta['layout'])
+
+    def __len__(self):
+        return len(next(iter(self._arrays.values()), ()))
+
+    @property
+    def columns(self):
+        return list(self._layout)
+
+    @property
+    def nbytes(self):
+        """Bytes of mapped column data (shared, not per session)."""
+        return sum(array.nbytes for array in self._arrays.values())
+
+    def codes(self, name):
+        """Read-only integer codes of a categorical column (-1 for missing)."""
+        return self._arrays[name]
+
+    def categories(self, name):
+        return self._dtypes[name].categories
+
+    @property
+    def category_index(self):
+        """:class:`CategoryIndex` over ``category_code``, built on first use."""
+        with self._lock:
+            if self._category_index is None:
+                self._category_index = CategoryIndex(self.codes('category_code'), self.categories('category_code'))
+        return self._category_index
+
+    def rows(self, *path, event_type=None):
+        """Row positions under category ``path``, optionally of one event type."""
+        rows = self.category_index.rows(*path)
+        if event_type is not None:
+            code = self.categories('event_type').get_indexer([event_type])[0]
+            rows = rows[self.codes('event_type')[rows] == code]
+        return rows
+
+    def column(self, name, rows=None):
+        """Column ``name`` as a Series; zero-copy when ``rows`` is None."""
+        values = self._arrays[name] if rows is None else self._arrays[name][rows]
+        spec = self._layout[name]
+        if spec['kind'] == 'category':
+            values = pd.Categorical.from_codes(values, dtype=self._dtypes[name])
+        elif spec['kind'] == 'datetime':
+            values = pd.DatetimeIndex(values.view(spec['dtype']))
+            if spec['tz'] is not None:
+                values = values.tz_localize('UTC').tz_convert(spec['tz'])
+        return pd.Series(values, name=name, copy=False)
+
+    def frame(self, columns=None, rows=None):
+        """The selected rows of ``columns`` (default: all) as a DataFrame."""
+        return pd.DataFrame({name: self.column(name, rows) for name in columns or self.columns}, copy=False)
+
+    def counts(self, name, rows=None):
+        """Non-zero counts of a categorical column's values, largest first.
+
+        Counted straight from the codes with ``bincount``; no frame is built.
+        """
+        codes = self._arrays[name] if rows is None else self._arrays[name][rows]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.categories(name)))
+        counts = pd.Series(counts, index=pd.CategoricalIndex(self.categories(name), dtype=self._dtypes[name], name=name), name='count')
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
@@ -0,0 +1,154 @@
+"""Date-partitioned event store with a manifest for pruning.
+
+The pipeline writes one CSV of events per day into a directory (a single
+export works too, as one partition).  Every partition is kept as compact
+Parquet, the cache of :func:`~techtrackr.ingest.load_events`, and a small
+JSON manifest records its row count, first and last ``event_time`` and the
+category codes it holds.  A query for a date range and category path checks
+the manifest first and reads only the partitions that can hold matching
+rows, and only the columns it needs, so "the last 7 days" of a year of
+partitions reads 7 files.
+"""
+import json
+import os
+import threading
+
+import pandas as pd
+
+from techtrackr.categories import split_code
+from techtrackr.ingest import DEFAULT_CACHE_DIR, TIMEZONE, concat_events, list_partitions, load_events, source_signature
+
+
+# Bumped whenever the manifest layout changes
+MANIFEST_VERSION = 1
+
+
+def _under(code, path):
+    return split_code(code)[:len(path)] == tuple(path)
+
+
+class EventStore:
+    """Partitions of an events source, described by a persisted manifest.
+
+    ``manifest`` maps each partition file to its ``signature`` (see
+    :func:`~techtrackr.ingest.source_signature`), ``rows``, ``min_time`` and
+    ``max_time`` (ISO UTC, None when empty) and sorted ``categories``.
+    :meth:`refresh` scans new or changed partitions into it.  Date ranges
+    are ``(first, last)`` pairs of days in
+    :data:`~techtrackr.ingest.TIMEZONE`, both included.
+    """
+
+    def __init__(self, source='events.csv', cache_dir=DEFAULT_CACHE_DIR):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.manifest = {}
+        self._lock = threading.Lock()
+        try:
+            with open(self._manifest_path(), 'r') as file:
+                meta = json.load(file)
+            if meta.get('version') == MANIFEST_VERSION:
+                self.manifest = meta['partitions']
+        except (OSError, ValueError):
+            pass
+
+    def _manifest_path(self):
+        stem = os.path.splitext(os.path.basename(os.path.normpath(self.source)))[0]
+        return os.path.join(self.cache_dir, stem + '.manifest.json')
+
+    def refresh(self, progress=None):
+        """Describe partitions added or changed since the last refresh.
+
+        A partition seen before costs one ``stat``; a new or changed one is
+        converted to Parquet (if not already) and read back for its
+        ``event_time`` and ``category_code``.  ``progress`` is called as
+        ``progress(partitions_done, partitions_total)``.
+        """
+        with self._lock:
+            files = list_partitions(self.source)
+            manifest = {}
+            for number, path in enumerate(files):
+                entry = self.manifest.get(path)
+                signature = source_signature(path, entry and entry['signature'])
+                if entry is None or entry['signature'] != signature:
+                    entry = self._describe(path, signature)
+                manifest[path] = entry
+                if progress is not None:
+                    progress(number + 1, len(files))
+            if manifest != self.manifest:
+                self.manifest = manifest
+                self.save()
+        return self
+
+    def _describe(self, path, signature):
+        data = load_events(path, self.cache_dir, columns=['event_time', 'category_code'])
+        times = data['event_time']
+        return {
+            'signature': signature,
+            'rows': len(data),
+            'min_time': times.min().isoformat() if len(data) else None,
+            'max_time': times.max().isoformat() if len(data) else None,
+            'categories': sorted(data['category_code'].dropna().unique().astype(str).tolist()),
+        }
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._manifest_path()
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'version': MANIFEST_VERSION, 'partitions': self.manifest}, file)
+        os.replace(path + '.tmp', path)
+
+    @property
+    def rows(self):
+        return sum(entry['rows'] for entry in self.manifest.values())
+
+    def span(self):
+        """First and last day with events, as dates; (None, None) when empty."""
+        times = [pd.Timestamp(entry[key]) for entry in self.manifest.values() if entry['rows'] for key in ('min_time', 'max_time')]
+        if not times:
+            return None, None
+        return min(times).tz_convert(TIMEZONE).date(), max(times).tz_convert(TIMEZONE).date()
+
+    def partitions(self, *path, dates=None):
+        """Partition files that can hold events under category ``path`` within ``dates``."""
+        if dates is not None:
+            start = pd.Timestamp(dates[0]).tz_localize(TIMEZONE)
+            stop = pd.Timestamp(dates[1]).tz_localize(TIMEZONE) + pd.Timedelta(days=1)
+        selected = []
+        for file, entry in self.manifest.items():
+            if not entry['rows']:
+                continue
+            if dates is not None and (pd.Timestamp(entry['max_time']) < start or pd.Timestamp(entry['min_time']) >= stop):
+                continue
+            # The empty path, like the category index's root, needs any category
+            if not any(_under(code, path) for code in entry['categories']):
+                continue
+            selected.append(file)
+        return selected
+
+    def load(self, *path, dates=None, event_type=None, columns=None):
+        """Events under category ``path`` within ``dates``, optionally of one event type.
+
+        Only the partitions that :meth:`partitions` selects are read, and of
+        them only ``columns`` (default all) plus those filtered on.
+        """
+        files = self.partitions(*path, dates=dates)
+        needed = None
+        if columns is not None:
+            needed = list(dict.fromkeys(list(columns) + ['category_code', 'event_date']
+                                        + (['event_type'] if event_type is not None else [])))
+        frames = []
+        for file in files:
+            data = load_events(file, self.cache_dir, columns=needed)
+            codes = data['category_code']
+            keep = codes.isin([code for code in codes.cat.categories if _under(code, path)])
+            if dates is not None:
+                keep &= (data['event_date'] >= pd.Timestamp(dates[0])) & (data['event_date'] <= pd.Timestamp(dates[1]))
+            if event_type is not None:
+                keep &= data['event_type'] == event_type
+            frames.append(data[keep])
+        if not frames:
+            # Typed like a partition, just without rows
+            first = next(iter(self.manifest), None)
+            frames = [load_events(first, self.cache_dir, columns=needed).iloc[:0]] if first else [pd.DataFrame(columns=needed)]
+        data = concat_events(frames).reset_index(drop=True)
+        return data if columns is None else data[list(columns)]
@@ -0,0 +1,44 @@
+"""Daily and hourly event counts per event type from a single groupby.
+
+The Dashboard's four time-series charts all derive from one
+(event_date, event_hour, event_type) count table.  It is computed in one pass
+and pivoted to a wide, zero-filled frame with one column per event type, so a
+day or hour without purchases shows as 0 instead of being dropped by a merge.
+"""
+import pandas as pd
+
+
+EVENT_TYPES = ['view', 'cart', 'purchase']
+
+HOURS = range(24)
+
+
+def event_time_series(frame, weights=None):
+    """Count events per (event_date, event_hour) with one column per event type.
+
+    ``frame`` is either raw events (each row counts once) or a rollup cube
+    table, in which case ``weights`` names its count column.
+    """
+    keys = ['event_date', 'event_hour', 'event_type']
+    grouped = frame.groupby(keys, observed=True, sort=False)
+    counts = grouped[weights].sum() if weights else grouped.size()
+
+    wide = counts.unstack('event_type', fill_value=0)
+    wide = wide.reindex(columns=EVENT_TYPES, fill_value=0)
+    wide.columns = pd.Index(EVENT_TYPES, name='event_type')
+    return wide.sort_index()
+
+
+def daily_counts(wide):
+    """Per-day totals, with days missing from the data filled with zeros."""
+    daily = wide.groupby(level='event_date').sum()
+    if not daily.empty:
+        days = pd.date_range(daily.index.min(), daily.index.max(), freq='D', name='event_date')
+        daily = daily.reindex(days.astype(daily.index.dtype), fill_value=0)
+    return daily
+
+
+def hourly_counts(wide):
+    """Per-hour-of-day totals for all 24 hours."""
+    hourly = wide.groupby(level='event_hour').sum()
+    return hourly.reindex(pd.Index(HOURS, name='event_hour'), fill_value=0)
@@ -0,0 +1,173 @@
+"""Top-k rankings and heavy-hitter sketches.
+
+The Dashboard ranks brands and categories several times per rerun: the top
+10 and the mode for the selected event type, and the mode again for each
+event type in the summary table.  :class:`Rankings` answers all of these from
+one grouped pass over the slice.  For slices too large to count exactly
+(``product_id`` over tens of millions of raw events, as in the Top Products
+drill-down), :func:`top_k` can pick the heaviest values with a
+:class:`SpaceSaving` summary and tighten their counts with a
+:class:`CountMinSketch`, both bounded in memory and fed chunk by chunk.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _ranked(counts):
+    """Sort a count Series largest first, ties alphabetically like ``mode()``."""
+    counts = counts[counts > 0]
+    frame = pd.DataFrame({'label': counts.index, 'count': counts.to_numpy()})
+    frame = frame.sort_values(['count', 'label'], ascending=[False, True], kind='stable')
+    return pd.Series(frame['count'].to_numpy(), index=pd.Index(frame['label'], name=counts.index.name), name='count')
+
+
+class Rankings:
+    """Per-group counts of several columns, from a single groupby.
+
+    ``frame`` is either raw events (each row counts once) or a rollup cube
+    table with ``weights`` naming its count column.  Rankings are kept per
+    value of ``by`` (the event type) and can also be asked for overall.
+    """
+
+    def __init__(self, frame, columns, by='event_type', weights=None):
+        keys = [by] + list(columns)
+        # Keep rows missing one column so they still count towards the others
+        grouped = frame.groupby(keys, observed=True, sort=False, dropna=False)
+        counts = grouped[weights].sum() if weights else grouped.size()
+        self.by = by
+        self._counts = {column: counts.groupby(level=[by, column], observed=True).sum() for column in columns}
+
+    @property
+    def nbytes(self):
+        """Memory held by the per-group counts, indexes included."""
+        return int(sum(counts.memory_usage(index=True, deep=True) for counts in self._counts.values()))
+
+    def counts(self, column, group=None):
+        """All counts of ``column``, largest first; overall when ``group`` is None."""
+        counts = self._counts[column]
+        if group is None:
+            counts = counts.groupby(level=column, observed=True).sum()
+        elif group in counts.index.get_level_values(self.by):
+            counts = counts.xs(group, level=self.by)
+        else:
+            counts = counts.iloc[:0].droplevel(self.by)
+        return _ranked(counts)
+
+    def top(self, column, group=None, k=10):
+        """The ``k`` most frequent values of ``column``; empty if there are none."""
+        return self.counts(column, group).head(k)
+
+    def most_common(self, column, group=None, default=None):
+        """Most frequent value of ``column``, or ``default`` for an empty slice."""
+        counts = self.counts(column, group)
+        return counts.index[0] if len(counts) else default
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters with at most ``capacity`` counters.
+
+    Batches are counted exactly and merged into the summary, so the Python
+    overhead is per batch rather than per event.  Estimates never undercount
+    and overcount by at most ``total / capacity``; any value more frequent
+    than that is guaranteed to be tracked.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.total = 0
+        self._counts = pd.Series(dtype='int64')
+        self._errors = pd.Series(dtype='int64')
+
+    def update(self, values, weights=None):
+        if weights is None:
+            batch = pd.Series(values).value_counts()
+        else:
+            batch = pd.Series(np.asarray(weights)).groupby(np.asarray(values)).sum()
+        batch = batch[batch > 0]
+        self.total += int(batch.sum())
+
+        # Values not tracked by a full summary may have occurred up to its
+        # smallest count, which is what the merged estimate assumes
+        floor = self._counts.min() if len(self._counts) >= self.capacity else 0
+        union = self._counts.index.union(batch.index)
+        counts = self._counts.reindex(union, fill_value=floor) + batch.reindex(union, fill_value=0)
+        errors = self._errors.reindex(union, fill_value=floor)
+
+        keep = counts.nlargest(self.capacity, keep='first').index
+        self._counts = counts[keep].astype('int64')
+        self._errors = errors[keep].astype('int64')
+        return self
+
+    def top(self, k=10):
+        """The ``k`` heaviest values with their (over-)estimated counts."""
+        return _ranked(self._counts).head(k)
+
+    def guaranteed(self, k=10):
+        """Lower bounds of the top-``k`` counts (estimate minus error)."""
+        top = self.top(k)
+        return top - self._errors[top.index]
+
+
+class CountMinSketch:
+    """Count-Min sketch: ``depth`` hashed rows of ``width`` counters.
+
+    Estimates never undercount; with probability ``1 - exp(-depth)`` they
+    overcount by at most ``e / width`` of the total weight.
+    """
+
+    def __init__(self, width=2 ** 16, depth=4, seed=0):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._table = np.zeros((depth, width), dtype=np.int64)
+        self._keys = [f'{seed + row:016d}' for row in range(depth)]
+
+    def _buckets(self, values):
+        values = pd.Series(values)
+        for row, key in enumerate(self._keys):
+            hashes = pd.util.hash_pandas_object(values, index=False, hash_key=key).to_numpy()
+            yield row, (hashes % np.uint64(self.width)).astype(np.int64)
+
+    def update(self, values, weights=None):
+        weights = np.ones(len(values), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        self.total += int(weights.sum())
+        for row, buckets in self._buckets(values):
+            np.add.at(self._table[row], buckets, weights)
+        return self
+
+    def estimate(self, values):
+        """Estimated counts of ``values``, as an array."""
+        estimates = None
+        for row, buckets in self._buckets(values):
+            counts = self._table[row, buckets]
+            estimates = counts if estimates is None else np.minimum(estimates, counts)
+        return estimates
+
+
+def top_k(values, k=10, weights=None, approximate=False, capacity=None, chunksize=1_000_000):
+    """The ``k`` most frequent values, largest first.
+
+    With ``approximate=True`` the values are fed in chunks of ``chunksize``
+    to a :class:`SpaceSaving` summary of ``capacity`` counters (default
+    ``100 * k``), which picks the candidates, and to a
+    :class:`CountMinSketch`; both overcount, so each candidate is ranked by
+    the smaller of the two estimates.  Memory is bounded by ``capacity``
+    and the sketch instead of the number of distinct values.
+    """
+    if not approximate:
+        if weights is None:
+            return _ranked(pd.Series(values).value_counts()).head(k)
+        return _ranked(pd.Series(np.asarray(weights)).groupby(np.asarray(values)).sum()).head(k)
+
+    summary = SpaceSaving(capacity or 100 * k)
+    sketch = CountMinSketch()
+    values = np.asarray(values)
+    weights = None if weights is None else np.asarray(weights)
+    for start in range(0, len(values), chunksize):
+        stop = start + chunksize
+        chunk_weights = None if weights is None else weights[start:stop]
+        summary.update(values[start:stop], chunk_weights)
+        sketch.update(values[start:stop], chunk_weights)
+    candidates = summary.top(summary.capacity)
+    estimates = np.minimum(candidates.to_numpy(), sketch.estimate(candidates.index.to_numpy()))
+    return _ranked(pd.Series(estimates, index=candidates.index)).head(k)
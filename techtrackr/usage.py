@@ -0,0 +1,464 @@
+"""Batched usage tracking for the Streamlit pages.
+
+``streamlit_analytics.track`` kept its counters in one dict per process and
+rewrote the whole JSON file synchronously at the end of every rerun, so
+concurrent sessions (and processes) raced on the file.  Here a rerun only
+appends events (script runs, pageviews, widget changes) to an in-memory
+buffer.  A background thread flushes the buffer in batches to an
+append-only SQLite table, which any number of sessions and processes can
+write to and web-analytics.py reads.  For other readers of the JSON
+counters layout of ``streamlit_analytics``, the tracker can also compact
+the table into such a file periodically (off unless
+``TECHTRACKR_USAGE_JSON`` names one).  The counters
+``streamlit_analytics`` left in dashboard.json are imported into a new
+table once, so no history is lost.
+:class:`UsageCounts` aggregates the table per day for web-analytics.py,
+reading only the rows appended since its last refresh.
+"""
+import atexit
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import pandas as pd
+import streamlit as st
+
+from techtrackr.memo import LRUMemo
+
+
+# Append-only event store, and the counters compacted from it if requested
+USAGE_DB = os.environ.get('TECHTRACKR_USAGE_DB', 'usage.sqlite3')
+USAGE_JSON = os.environ.get('TECHTRACKR_USAGE_JSON')
+
+# Counters written by streamlit_analytics, imported into the store once.
+# web-analytics.json is an earlier snapshot of the same counters, so
+# importing it as well would count its events twice
+LEGACY_JSON = ['dashboard.json']
+
+# Widget functions tracked, by how their value is counted
+SELECT_WIDGETS = ['radio', 'selectbox', 'select_slider']
+SWITCH_WIDGETS = ['checkbox', 'toggle']
+BUTTON_WIDGETS = ['button']
+
+COLUMNS = ['time', 'day', 'session', 'page', 'kind', 'widget', 'value', 'seconds']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    time REAL NOT NULL,
+    day TEXT NOT NULL,
+    session TEXT NOT NULL,
+    page TEXT,
+    kind TEXT NOT NULL,
+    widget TEXT,
+    value TEXT,
+    seconds REAL
+);
+CREATE INDEX IF NOT EXISTS events_day ON events (day, kind);
+CREATE INDEX IF NOT EXISTS events_widget ON events (kind, widget, day);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    time REAL NOT NULL
+);
+"""
+
+INSERT = f"INSERT INTO events VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+def _empty(value):
+    # streamlit_analytics records empty selections as a single space
+    return ' ' if value == '' or value is None else str(value)
+
+
+def counter_events(counters):
+    """Event rows, laid out as :data:`COLUMNS`, adding up to ``streamlit_analytics`` counters.
+
+    Pageviews and script runs are dated by ``per_day``; widget counts, which
+    have no date, and the total time go to the last day.  Rows of the day
+    tracking started are stamped with ``start_time``, the others with
+    midnight.
+    """
+    try:
+        start = datetime.datetime.strptime(counters.get('start_time', ''), '%d %b %Y, %H:%M:%S')
+    except ValueError:
+        start = None
+    per_day = counters.get('per_day', {})
+    days = per_day.get('days', [])
+    if not days:
+        return []
+
+    def event(day, kind, widget=None, value=None, seconds=None):
+        moment = datetime.datetime.fromisoformat(day)
+        if start is not None and start.date() == moment.date():
+            moment = start
+        return (moment.timestamp(), day, 'imported', None, kind, widget, value, seconds)
+
+    rows = []
+    for day, pageviews, script_runs in zip(days, per_day.get('pageviews', []), per_day.get('script_runs', [])):
+        rows += [event(day, 'pageview')] * pageviews + [event(day, 'run')] * script_runs
+    runs = [number for number, row in enumerate(rows) if row[4] == 'run']
+    if runs:
+        rows[runs[-1]] = rows[runs[-1]][:-1] + (counters.get('total_time_seconds', 0),)
+    for widget, counts in counters.get('widgets', {}).items():
+        if isinstance(counts, dict):
+            for value, count in counts.items():
+                rows += [event(days[-1], 'select', widget, value)] * count
+        else:
+            rows += [event(days[-1], 'switch', widget)] * counts
+    return rows
+
+
+class UsageStore:
+    """SQLite table of usage events; safe to share between processes.
+
+    The counters files in ``imports`` are added to the table the first time
+    the store sees them.
+    """
+
+    def __init__(self, path=USAGE_DB, imports=LEGACY_JSON):
+        self.path = path
+        with contextlib.closing(self.connect()) as connection, connection:
+            connection.executescript(SCHEMA)
+        for json_path in imports:
+            self.import_counters(json_path)
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        # Readers do not block the writer and vice versa
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def append(self, rows, connection=None):
+        """Insert event tuples laid out as :data:`COLUMNS` in one transaction."""
+        if not rows:
+            return
+        with contextlib.ExitStack() as stack:
+            if connection is None:
+                connection = stack.enter_context(contextlib.closing(self.connect()))
+            with connection:
+                connection.executemany(INSERT, rows)
+
+    def import_counters(self, json_path):
+        """Add the counters of a ``streamlit_analytics`` JSON file as events, once.
+
+        Returns how many events were added: none when the file is missing,
+        unreadable or already imported.
+        """
+        try:
+            with open(json_path, 'r') as file:
+                rows = counter_events(json.load(file))
+        except (OSError, ValueError, TypeError):
+            return 0
+        with contextlib.closing(self.connect()) as connection, connection:
+            # Taken before the check so concurrent processes import it only once
+            connection.execute('BEGIN IMMEDIATE')
+            key = os.path.abspath(json_path)
+            if connection.execute('SELECT 1 FROM imports WHERE path = ?', (key,)).fetchone():
+                return 0
+            connection.execute('INSERT INTO imports VALUES (?, ?)', (key, time.time()))
+            connection.executemany(INSERT, rows)
+        return len(rows)
+
+    def counters(self):
+        """All events aggregated into the ``streamlit_analytics`` counters layout."""
+        with contextlib.closing(self.connect()) as connection:
+            totals = connection.execute(
+                "SELECT SUM(kind = 'pageview'), SUM(kind = 'run'), COALESCE(SUM(seconds), 0), MIN(time) FROM events"
+            ).fetchone()
+            per_day = connection.execute(
+                "SELECT day, SUM(kind = 'pageview'), SUM(kind = 'run') FROM events GROUP BY day ORDER BY day"
+            ).fetchall()
+            widgets = connection.execute(
+                "SELECT kind, widget, value, COUNT(*) FROM events WHERE kind IN ('select', 'switch', 'button') "
+                "GROUP BY kind, widget, value ORDER BY MIN(rowid)"
+            ).fetchall()
+
+        counters = {
+            'loaded_from_firestore': False,
+            'total_pageviews': totals[0] or 0,
+            'total_script_runs': totals[1] or 0,
+            'total_time_seconds': totals[2],
+            'per_day': {'days': [], 'pageviews': [], 'script_runs': []},
+            'widgets': {},
+            'start_time': datetime.datetime.fromtimestamp(totals[3] or time.time()).strftime('%d %b %Y, %H:%M:%S'),
+        }
+        # Consecutive days, with zeros for days without traffic
+        runs = {day: (pageviews, script_runs) for day, pageviews, script_runs in per_day}
+        if runs:
+            day, last = datetime.date.fromisoformat(per_day[0][0]), datetime.date.fromisoformat(per_day[-1][0])
+            while day <= last:
+                pageviews, script_runs = runs.get(day.isoformat(), (0, 0))
+                counters['per_day']['days'].append(day.isoformat())
+                counters['per_day']['pageviews'].append(pageviews)
+                counters['per_day']['script_runs'].append(script_runs)
+                day += datetime.timedelta(days=1)
+        for kind, widget, value, count in widgets:
+            if kind == 'select':
+                counters['widgets'].setdefault(widget, {})[value] = count
+            else:
+                counters['widgets'][widget] = counters['widgets'].get(widget, 0) + count
+        return counters
+
+
+class UsageCounts:
+    """Per-day usage aggregates of a :class:`UsageStore`, refreshed incrementally.
+
+    The events table is append-only, so :meth:`refresh` aggregates just the
+    rows past the last rowid it has seen and adds them to the totals held in
+    memory.  Queries take an optional inclusive ``start``/``end`` date window
+    and are memoized under ``(version, query, start, end)``; the version is
+    bumped by every refresh that finds new events.
+    """
+
+    def __init__(self, store, memo=None):
+        self.store = store
+        self.memo = memo if memo is not None else LRUMemo(max_entries=64)
+        self.version = 0
+        self.last_rowid = 0
+        self._days = pd.DataFrame(
+            {'pageviews': pd.Series(dtype='int64'), 'script_runs': pd.Series(dtype='int64'),
+             'seconds': pd.Series(dtype='float64'), 'first_time': pd.Series(dtype='float64')},
+            index=pd.DatetimeIndex([], name='day'),
+        )
+        self._widgets = pd.DataFrame({
+            'day': pd.DatetimeIndex([]), 'kind': pd.Series(dtype=object), 'widget': pd.Series(dtype=object),
+            'value': pd.Series(dtype=object), 'count': pd.Series(dtype='int64'),
+        })
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Fold the events appended since the last refresh into the aggregates."""
+        with self._lock, contextlib.closing(self.store.connect()) as connection:
+            last = connection.execute('SELECT MAX(rowid) FROM events').fetchone()[0] or 0
+            if last <= self.last_rowid:
+                return self
+            # Range scans of the rowid, however long the table has grown
+            window = (self.last_rowid, last)
+            days = pd.DataFrame(connection.execute(
+                "SELECT day, SUM(kind = 'pageview'), SUM(kind = 'run'), COALESCE(SUM(seconds), 0), MIN(time) "
+                "FROM events WHERE rowid > ? AND rowid <= ? GROUP BY day", window
+            ).fetchall(), columns=['day', 'pageviews', 'script_runs', 'seconds', 'first_time'])
+            widgets = pd.DataFrame(connection.execute(
+                "SELECT day, kind, widget, value, COUNT(*) FROM events "
+                "WHERE rowid > ? AND rowid <= ? AND kind IN ('select', 'switch', 'button') "
+                "GROUP BY day, kind, widget, value ORDER BY MIN(rowid)", window
+            ).fetchall(), columns=['day', 'kind', 'widget', 'value', 'count'])
+
+            days = days.assign(day=pd.to_datetime(days['day'])).set_index('day')
+            combined = pd.concat([self._days, days])
+            self._days = combined.groupby(level='day').agg({
+                'pageviews': 'sum', 'script_runs': 'sum', 'seconds': 'sum', 'first_time': 'min',
+            }).sort_index()
+            widgets['day'] = pd.to_datetime(widgets['day'])
+            self._widgets = pd.concat([self._widgets, widgets], ignore_index=True).groupby(
+                ['day', 'kind', 'widget', 'value'], dropna=False, sort=False, as_index=False)['count'].sum()
+            self.last_rowid = last
+            self.version += 1
+        return self
+
+    @property
+    def empty(self):
+        return self._days.empty
+
+    def span(self):
+        """First and last day with events, as dates."""
+        return self._days.index[0].date(), self._days.index[-1].date()
+
+    def start_time(self):
+        """When the first event was recorded."""
+        return datetime.datetime.fromtimestamp(self._days['first_time'].min())
+
+    def _cached(self, name, compute, start, end):
+        return self.memo.get((self.version, name, start, end), compute)
+
+    @staticmethod
+    def _within(days, start, end):
+        mask = pd.Series(True, index=days.index)
+        if start is not None:
+            mask &= days >= pd.Timestamp(start)
+        if end is not None:
+            mask &= days <= pd.Timestamp(end)
+        return mask
+
+    def per_day(self, start=None, end=None):
+        """Pageviews, script runs and seconds per day, days without events as zeros."""
+        def compute():
+            days = self._days.loc[self._within(self._days.index.to_series(), start, end), ['pageviews', 'script_runs', 'seconds']]
+            if days.empty:
+                return days
+            return days.asfreq('D', fill_value=0)
+        return self._cached('per_day', compute, start, end)
+
+    def totals(self, start=None, end=None):
+        """Total pageviews, script runs and seconds."""
+        def compute():
+            days = self.per_day(start, end)
+            return {column: days[column].sum() for column in days}
+        return self._cached('totals', compute, start, end)
+
+    def widget_counts(self, widget, start=None, end=None):
+        """Times each value of a select widget was chosen, or a switch or
+        button widget was used (a single count under None), most frequent first."""
+        def compute():
+            widgets = self._widgets[(self._widgets['widget'] == widget) & self._within(self._widgets['day'], start, end)]
+            return widgets.groupby('value', dropna=False, sort=False)['count'].sum().sort_values(ascending=False, kind='stable')
+        return self._cached(('widget_counts', widget), compute, start, end)
+
+
+class UsageTracker:
+    """Buffer usage events in memory and write them from a background thread.
+
+    The buffer is flushed every ``flush_interval`` seconds, or sooner once it
+    holds ``max_buffer`` events, and at interpreter exit.  Every
+    ``compact_interval`` seconds after new events, the counters are
+    rewritten to ``json_path``; by default (None) nothing is compacted.
+    """
+
+    def __init__(self, store, json_path=USAGE_JSON, flush_interval=5.0, compact_interval=60.0, max_buffer=1000):
+        self.store = store
+        self.json_path = json_path
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._pending_compaction = False
+        self._thread = threading.Thread(target=self._run, name='usage-tracker', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, session, page, kind, widget=None, value=None, seconds=None):
+        """Queue one event; never touches the disk."""
+        now = time.time()
+        event = (now, datetime.date.fromtimestamp(now).isoformat(), session, page, kind, widget, value, seconds)
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.max_buffer
+        if full:
+            self._wake.set()
+
+    def flush(self, connection=None):
+        """Write the buffered events; returns how many were written."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        try:
+            self.store.append(rows, connection)
+        except (OSError, sqlite3.Error):
+            # Kept for the next batch, ahead of anything recorded meanwhile
+            with self._lock:
+                self._buffer[:0] = rows
+            raise
+        if rows:
+            self._pending_compaction = True
+        return len(rows)
+
+    def compact(self):
+        """Rewrite the counters JSON from every stored event."""
+        if self.json_path is None:
+            return
+        counters = self.store.counters()
+        with open(self.json_path + '.tmp', 'w') as file:
+            json.dump(counters, file)
+        os.replace(self.json_path + '.tmp', self.json_path)
+        self._pending_compaction = False
+
+    def _run(self):
+        connection = self.store.connect()
+        last_compaction = time.monotonic()
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush(connection)
+                if self._pending_compaction and time.monotonic() - last_compaction >= self.compact_interval:
+                    self.compact()
+                    last_compaction = time.monotonic()
+            except (OSError, sqlite3.Error):
+                # Tracking must never break the page; unwritten events stay
+                # buffered and are retried with the next batch
+                pass
+        connection.close()
+
+    def close(self):
+        """Stop the thread, write what is left and compact once more."""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        if self._pending_compaction:
+            self.compact()
+
+
+_install_lock = threading.Lock()
+_installed = False
+
+# Distinct from every widget value, so a widget's first render counts
+_UNSET = object()
+
+
+def _wrap(function, kind):
+    def tracked(label, *args, **kwargs):
+        value = function(label, *args, **kwargs)
+        state = st.session_state.get('usage')
+        if state is None or state.get('tracker') is None:
+            return value
+        # Buttons count clicks, other widgets count changes of their value
+        # (including the first render in a session), as streamlit_analytics did
+        if kind == 'button':
+            changed = bool(value)
+        else:
+            changed = state['values'].get(label, _UNSET) != value
+            state['values'][label] = value
+        if changed:
+            state['tracker'].record(state['session'], state['page'], kind, _empty(label),
+                                    _empty(value) if kind == 'select' else None)
+        return value
+    tracked.__wrapped__ = function
+    return tracked
+
+
+def _install():
+    """Wrap the widget functions of ``st`` and ``st.sidebar``, once per process.
+
+    The wrappers stay in place and only record for sessions inside
+    :func:`track`; patching per rerun, as ``streamlit_analytics`` did, races
+    between concurrent sessions.
+    """
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        for kind, names in (('select', SELECT_WIDGETS), ('switch', SWITCH_WIDGETS), ('button', BUTTON_WIDGETS)):
+            for owner in (st, st.sidebar):
+                for name in names:
+                    setattr(owner, name, _wrap(getattr(owner, name), kind))
+        _installed = True
+
+
+@contextlib.contextmanager
+def track(tracker, page):
+    """Record a script run of ``page`` and the widget changes of its session.
+
+    Widgets rendered by fragments rerunning later on their own keep being
+    recorded for the page of the session's last run.
+    """
+    _install()
+    if 'usage' not in st.session_state:
+        st.session_state.usage = {'session': uuid.uuid4().hex, 'last_time': time.time(), 'viewed': False, 'values': {}}
+    state = st.session_state.usage
+    now = time.time()
+    state.update(tracker=tracker, page=page)
+    if not state['viewed']:
+        state['viewed'] = True
+        tracker.record(state['session'], page, 'pageview')
+    tracker.record(state['session'], page, 'run', seconds=now - state['last_time'])
+    state['last_time'] = now
+    yield
@@ -0,0 +1,117 @@
+"""Precomputed aggregates for the most used selections, kept across restarts.
+
+The memo of a Dashboard process starts empty, so after every deploy or
+restart the first user to open a category waits for all of its aggregates.
+A warm-up computes :data:`~techtrackr.analytics.REPORTS` (and with them the
+summaries, rankings and time series they build on) for the empty selection
+and the ``top`` category paths chosen most often in the sidebar, according
+to the usage store, and pickles the memoized results next to the rollup
+cube.  The file is tagged with :attr:`RollupCube.signature
+<techtrackr.rollup.RollupCube.signature>`, so it only restores into a cube
+built from the same source bytes; any change to the source makes it stale
+until the next warm-up.  Run it from cron or a deploy hook::
+
+    python -m techtrackr.report events.csv --warm 20
+"""
+import json
+import os
+import pickle
+
+from techtrackr.analytics import Analytics
+from techtrackr.memo import LRUMemo
+from techtrackr.usage import UsageCounts, UsageStore
+
+
+# Bumped whenever the pickled layout changes
+WARM_VERSION = 1
+
+# Labels of the sidebar category widgets, one per level
+CATEGORY_WIDGETS = ['Select Top-Level Category', 'Select First Sub-Level Category', 'Select Second Sub-Level Category']
+
+
+def warm_path(cube):
+    stem = os.path.splitext(os.path.basename(os.path.normpath(cube.source)))[0]
+    return os.path.join(cube.cache_dir, stem + '.warm.pickle')
+
+
+def widget_counts(usage):
+    """Value counts of the category widgets, by label.
+
+    ``usage`` is a :class:`~techtrackr.usage.UsageStore` database or a JSON
+    file in the ``streamlit_analytics`` counters layout (web-analytics.json,
+    or the dashboard.json it used to write).
+    """
+    if not os.path.exists(usage):
+        return {label: {} for label in CATEGORY_WIDGETS}
+    if usage.endswith('.json'):
+        with open(usage, 'r') as file:
+            widgets = json.load(file).get('widgets', {})
+        return {label: dict(widgets.get(label) or {}) for label in CATEGORY_WIDGETS}
+
+    counts = UsageCounts(UsageStore(usage)).refresh()
+    return {label: counts.widget_counts(label).to_dict() for label in CATEGORY_WIDGETS}
+
+
+def popular_selections(core, counts, top=20):
+    """The empty path and the ``top`` most used category paths, most used first.
+
+    Widgets only count values level by level, so a path scores the smallest
+    count among its levels: it cannot have been chosen more often than any
+    of them.
+    """
+    scores = {}
+    for path in core.category_paths():
+        if path:
+            score = min(counts[CATEGORY_WIDGETS[depth]].get(name, 0) for depth, name in enumerate(path))
+            if score > 0:
+                scores[path] = score
+    return [()] + sorted(scores, key=scores.get, reverse=True)[:top]
+
+
+def warm(core, selections):
+    """Compute every report of ``selections`` into ``core``'s memo."""
+    for path in selections:
+        core.report(*path)
+
+
+def save(memo, cube, path=None):
+    """Persist the memoized entries of ``cube``'s current version; returns how many."""
+    entries = {key[1:]: value for key, value in memo.items() if key[0] == cube.version}
+    path = path or warm_path(cube)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as file:
+        pickle.dump({'version': WARM_VERSION, 'signature': cube.signature, 'entries': entries}, file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+    return len(entries)
+
+
+def restore(memo, cube, path=None):
+    """Load persisted entries into ``memo`` for ``cube``'s current version.
+
+    Returns how many were loaded; none when the file is missing, from an
+    older layout or for other source data.
+    """
+    try:
+        with open(path or warm_path(cube), 'rb') as file:
+            warmed = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return 0
+    if warmed.get('version') != WARM_VERSION or warmed.get('signature') != cube.signature:
+        return 0
+    for key, value in warmed['entries'].items():
+        memo.put((cube.version,) + key, value)
+    return len(warmed['entries'])
+
+
+def warm_up(cube, usage, top=20):
+    """Warm the ``top`` most used selections of ``cube`` and persist them.
+
+    Returns the selections and the number of entries written.
+    """
+    # Nothing is evicted while warming; restoring applies the usual bounds
+    memo = LRUMemo(max_entries=1 << 20, max_bytes=1 << 40)
+    core = Analytics(cube, memo=memo)
+    selections = popular_selections(core, widget_counts(usage), top)
+    warm(core, selections)
+    return selections, save(memo, cube)
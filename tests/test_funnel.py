@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from techtrackr.funnel import Funnel
+from techtrackr.shared import SharedEvents, write_shared
+
+
+START = pd.Timestamp('2019-10-01 10:00:00', tz='UTC')
+
+PRODUCTS = {
+    1: ('electronics.smartphone', 'acme'),
+    2: ('electronics.audio.headphone', 'zeta'),
+    3: (None, 'acme'),
+}
+
+# (session, product, event type, seconds after START)
+EVENTS = [
+    # Viewed, carted a minute later and purchased two minutes after the view
+    ('s1', 1, 'view', 0), ('s1', 1, 'cart', 60), ('s1', 1, 'purchase', 120),
+    # Carted before it was viewed: only the view counts
+    ('s1', 2, 'cart', 10), ('s1', 2, 'view', 20),
+    # Purchased before the cart: the purchase does not count
+    ('s2', 1, 'view', 0), ('s2', 1, 'purchase', 30), ('s2', 1, 'cart', 90),
+    # No category: outside every category path
+    ('s2', 3, 'view', 0), ('s2', 3, 'cart', 5),
+    # No session: not followed at all
+    (None, 1, 'view', 0), (None, 1, 'cart', 1), (None, 1, 'purchase', 2),
+]
+
+
+@pytest.fixture
+def events():
+    session, product, event_type, seconds = zip(*EVENTS)
+    category, brand = zip(*(PRODUCTS[number] for number in product))
+    return pd.DataFrame({
+        'event_time': START + pd.to_timedelta(seconds, unit='s'),
+        'event_type': pd.Categorical(event_type, categories=['cart', 'purchase', 'view']),
+        'product_id': np.array(product, dtype='int32'),
+        'category_code': pd.Categorical(category),
+        'brand': pd.Categorical(brand),
+        'user_session': pd.Categorical(session),
+    })
+
+
+def test_conversion_overall(events):
+    table = Funnel.from_frame(events).conversion()
+    row = table.loc['All']
+    assert row[['views', 'carts', 'purchases']].tolist() == [3, 2, 1]
+    assert row['cart_rate'] == pytest.approx(2 / 3)
+    assert row['purchase_rate'] == pytest.approx(1 / 2)
+    assert row['conversion_rate'] == pytest.approx(1 / 3)
+    assert row['median_time_to_cart'] == 75
+    assert row['median_time_to_purchase'] == 120
+
+
+def test_conversion_by_breakdown(events):
+    funnel = Funnel.from_frame(events)
+    by_brand = funnel.conversion(by='brand')
+    assert by_brand.index.tolist() == ['acme', 'zeta']
+    assert by_brand[['views', 'carts', 'purchases']].to_numpy().tolist() == [[2, 2, 1], [1, 0, 0]]
+    assert np.isnan(by_brand.loc['zeta', 'purchase_rate'])
+
+    by_leaf = funnel.conversion(by='category')
+    assert by_leaf['views'].to_dict() == {'smartphone': 2, 'headphone': 1}
+    audio = funnel.conversion('electronics', 'audio')
+    assert audio.loc['All', ['views', 'carts']].tolist() == [1, 0]
+
+
+def test_shared_events_give_the_same_funnel(events, tmp_path):
+    path, categories_path = str(tmp_path / 'events.arrow'), str(tmp_path / 'categories.arrow')
+    shared = SharedEvents(path, categories_path, write_shared(events, path, categories_path))
+    from_events = Funnel.from_events(shared).conversion(by='brand')
+    pd.testing.assert_frame_equal(from_events, Funnel.from_frame(events).conversion(by='brand'))
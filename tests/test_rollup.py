@@ -0,0 +1,85 @@
+import pytest
+
+from techtrackr import rollup
+from techtrackr.ingest import load_events
+from techtrackr.rollup import RollupCube
+
+
+HEADER = 'event_time,event_type,product_id,category_id,category_code,brand,price,user_id,user_session\n'
+ROWS = [
+    '2019-10-01 00:06:48 UTC,view,36172146,2053013552226107623,jewelry,acme,41.23,531927379,s1\n',
+    '2019-10-01 00:08:26 UTC,cart,36172146,2053013552226107623,jewelry,acme,41.23,531927379,s1\n',
+    '2019-10-01 00:08:35 UTC,purchase,36172146,2053013552226107623,jewelry,acme,41.23,531927379,s1\n',
+]
+
+
+def append(path, text):
+    with open(path, 'a') as file:
+        file.write(text)
+
+
+def test_last_row_without_newline(tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_text(HEADER + ''.join(ROWS).rstrip('\n'))
+    cube = RollupCube(str(path), cache_dir=str(tmp_path / 'cache')).refresh()
+    # The last row may still be being written; it counts once the file stays unchanged
+    assert cube.table['count'].sum() == 2
+    assert cube.refresh().table['count'].sum() == len(load_events(str(path), use_cache=False)) == 3
+
+    # Nothing appended: the cube is current and keeps its version
+    version = cube.version
+    assert cube._is_current()
+    assert cube.refresh().version == version
+
+    # Rows appended after a newline are folded in
+    append(path, '\n' + ROWS[0])
+    assert cube.refresh().table['count'].sum() == 4
+
+
+def test_partial_line_waits_for_its_newline(tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_text(HEADER + ROWS[0])
+    cube = RollupCube(str(path), cache_dir=str(tmp_path / 'cache')).refresh()
+    version = cube.version
+
+    append(path, ROWS[1][:20])
+    assert cube.refresh().version == version
+    # Unchanged, but not a valid row: left out without failing
+    assert cube.refresh().version == version
+    assert cube._is_current()
+
+    append(path, ROWS[1][20:])
+    assert cube.refresh().table['count'].sum() == 2
+
+
+def test_new_partition_with_partial_line(tmp_path):
+    path = tmp_path / 'events.csv'
+    path.write_text(HEADER + ROWS[0] + ROWS[1][:15])
+    cube = RollupCube(str(path), cache_dir=str(tmp_path / 'cache')).refresh()
+    assert cube.table['count'].sum() == 1
+
+
+def test_continued_last_row_is_read_again(tmp_path, monkeypatch):
+    # Price last, so a row cut inside it is valid, with the wrong price
+    header, rows = HEADER.replace('price,', '').rstrip('\n') + ',price\n', []
+    for row in ROWS:
+        fields = row.rstrip('\n').split(',')
+        rows.append(','.join(fields[:6] + fields[7:] + fields[6:7]) + '\n')
+    source = tmp_path / 'events'
+    source.mkdir()
+    (source / '2019-09-30.csv').write_text(header + rows[0])
+    path = source / '2019-10-01.csv'
+    path.write_text(header + rows[0] + rows[1][:-2])
+    cube = RollupCube(str(source), cache_dir=str(tmp_path / 'cache')).refresh().refresh()
+    assert cube.table['count'].sum() == 3
+    assert cube.table['price_sum'].sum() == pytest.approx(41.23 * 2 + 41.2)
+
+    read = []
+    aggregate_range = rollup.aggregate_range
+    monkeypatch.setattr(rollup, 'aggregate_range', lambda path, *args: read.append(path) or aggregate_range(path, *args))
+    append(path, rows[1][-2:] + rows[2])
+    cube.refresh()
+    assert cube.table['count'].sum() == 4
+    assert cube.table['price_sum'].sum() == pytest.approx(41.23 * 4)
+    # Only the continued partition is read, not the whole source again
+    assert set(read) == {str(path)}
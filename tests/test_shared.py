@@ -0,0 +1,22 @@
+from techtrackr.shared import SharedEvents
+
+
+HEADER = 'event_time,event_type,product_id,category_id,category_code,brand,price,user_id,user_session\n'
+ROW = '2019-10-01 00:06:48 UTC,view,36172146,2053013552226107623,jewelry,acme,41.23,531927379,s1\n'
+
+
+def test_partial_line_waits_until_finished(tmp_path):
+    path = tmp_path / 'events.csv'
+    cache_dir = str(tmp_path / 'cache')
+    path.write_text(HEADER + ROW + ROW[:15])
+    assert len(SharedEvents.open(str(path), cache_dir)) == 1
+    # Not a valid row even once the file stopped growing
+    assert len(SharedEvents.open(str(path), cache_dir)) == 1
+
+    with open(path, 'a') as file:
+        file.write(ROW[15:] + ROW.rstrip('\n'))
+    assert len(SharedEvents.open(str(path), cache_dir)) == 2
+    # Unchanged since: the last row is complete
+    events = SharedEvents.open(str(path), cache_dir)
+    assert len(events) == 3
+    assert events.column('brand').tolist() == ['acme'] * 3
@@ -0,0 +1,59 @@
+import datetime
+
+from techtrackr.store import EventStore
+
+
+HEADER = 'event_time,event_type,product_id,category_id,category_code,brand,price,user_id,user_session\n'
+DAYS = {
+    '2019-10-01.csv': [
+        '2019-10-01 08:00:00 UTC,view,1,10,electronics.smartphone,acme,100.0,7,s1\n',
+        '2019-10-01 08:01:00 UTC,cart,1,10,electronics.smartphone,acme,100.0,7,s1\n',
+    ],
+    '2019-10-02.csv': [],
+    '2019-10-03.csv': [
+        '2019-10-03 09:00:00 UTC,view,2,20,apparel.shoes,zeta,50.0,8,s2\n',
+        '2019-10-03 09:05:00 UTC,view,1,10,electronics.smartphone,acme,100.0,8,s2\n',
+        '2019-10-03 09:06:00 UTC,purchase,1,10,electronics.smartphone,acme,100.0,8,s2\n',
+    ],
+}
+
+
+def make_store(tmp_path):
+    source = tmp_path / 'events'
+    source.mkdir()
+    for name, rows in DAYS.items():
+        (source / name).write_text(HEADER + ''.join(rows))
+    return EventStore(str(source), cache_dir=str(tmp_path / 'cache')).refresh(), source
+
+
+def test_partition_without_rows(tmp_path):
+    store, source = make_store(tmp_path)
+    entry = store.manifest[str(source / '2019-10-02.csv')]
+    assert entry['rows'] == 0 and entry['min_time'] is None and entry['categories'] == []
+    assert store.rows == 5
+    assert store.span() == (datetime.date(2019, 10, 1), datetime.date(2019, 10, 3))
+
+    # Typed like any other partition, even when nothing is selected
+    data = store.load('books', columns=['event_type', 'category_code'])
+    assert data.empty and data['category_code'].dtype == 'category'
+
+
+def test_partitions_pruned_by_dates_and_category(tmp_path):
+    store, source = make_store(tmp_path)
+    first, third = str(source / '2019-10-01.csv'), str(source / '2019-10-03.csv')
+    assert store.partitions() == [first, third]
+    assert store.partitions(dates=(datetime.date(2019, 10, 2), datetime.date(2019, 10, 3))) == [third]
+    assert store.partitions('apparel') == [third]
+    assert store.partitions('electronics', 'smartphone', dates=(datetime.date(2019, 10, 1), datetime.date(2019, 10, 1))) == [first]
+    assert store.partitions('apparel', dates=(datetime.date(2019, 10, 1), datetime.date(2019, 10, 2))) == []
+
+
+def test_load_filters_rows_and_columns(tmp_path):
+    store, _ = make_store(tmp_path)
+    data = store.load('electronics', event_type='view', columns=['product_id', 'user_id'])
+    assert list(data.columns) == ['product_id', 'user_id']
+    assert data['user_id'].tolist() == [7, 8]
+
+    data = store.load(dates=(datetime.date(2019, 10, 3), datetime.date(2019, 10, 3)))
+    assert len(data) == 3
+    assert sorted(data['category_code'].astype(str)) == ['apparel.shoes', 'electronics.smartphone', 'electronics.smartphone']
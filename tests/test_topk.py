@@ -0,0 +1,13 @@
+import numpy as np
+
+from techtrackr.topk import top_k
+
+
+def test_approximate_top_k_matches_exact_on_skewed_values():
+    rng = np.random.default_rng(0)
+    values = rng.zipf(1.5, 200_000) % 50_000
+    exact = top_k(values, 10)
+    approximate = top_k(values, 10, approximate=True, chunksize=10_000)
+    assert approximate.index.tolist() == exact.index.tolist()
+    # Both sketches overcount, never undercount
+    assert (approximate >= exact).all()
@@ -0,0 +1,54 @@
+import datetime
+import os
+
+from techtrackr.usage import LEGACY_JSON, UsageCounts, UsageStore, UsageTracker
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_legacy_counters_are_imported_once(tmp_path):
+    imports = [os.path.join(ROOT, name) for name in LEGACY_JSON]
+    store = UsageStore(str(tmp_path / 'usage.sqlite3'), imports=imports)
+    # A second store (or process) on the same database imports nothing more
+    UsageStore(store.path, imports=imports)
+
+    counters = store.counters()
+    assert counters['total_pageviews'] == 2
+    assert counters['total_script_runs'] == 5
+    assert counters['total_time_seconds'] == 306.03413
+    assert counters['start_time'] == '07 Dec 2023, 08:16:53'
+    assert counters['widgets']['Select Event Type'] == {'purchase': 2}
+    assert counters['widgets']['Go to'] == {'Home': 1, 'Dashboard': 1}
+
+
+def test_counts_refresh_incrementally(tmp_path):
+    store = UsageStore(str(tmp_path / 'usage.sqlite3'), imports=[])
+    tracker = UsageTracker(store, flush_interval=3600)
+    counts = UsageCounts(store)
+    assert counts.refresh().empty
+
+    tracker.record('s1', 'Dashboard', 'pageview')
+    tracker.record('s1', 'Dashboard', 'run', seconds=1.5)
+    tracker.record('s1', 'Dashboard', 'select', 'Select Event Type', 'view')
+    assert tracker.flush() == 3
+    counts.refresh()
+    version = counts.version
+    assert counts.totals() == {'pageviews': 1, 'script_runs': 1, 'seconds': 1.5}
+
+    tracker.record('s1', 'Dashboard', 'run', seconds=2.0)
+    tracker.record('s1', 'Dashboard', 'select', 'Select Event Type', 'cart')
+    tracker.record('s2', 'Dashboard', 'select', 'Select Event Type', 'cart')
+    tracker.record('s2', 'Dashboard', 'switch', 'Show Event Summary')
+    tracker.close()
+    # Only the rows appended since are read, and memoized results are not reused
+    assert counts.refresh().version == version + 1
+    assert counts.last_rowid == 7
+    assert counts.totals() == {'pageviews': 1, 'script_runs': 2, 'seconds': 3.5}
+    assert counts.widget_counts('Select Event Type').to_dict() == {'cart': 2, 'view': 1}
+    assert counts.widget_counts('Show Event Summary').tolist() == [1]
+
+    today = datetime.date.today()
+    assert counts.span() == (today, today)
+    yesterday = today - datetime.timedelta(days=1)
+    assert counts.widget_counts('Select Event Type', yesterday, yesterday).empty
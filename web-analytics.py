@@ -1,29 +1,38 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import json
 
-# Load the data from web-analytics.json
-with open('web-analytics.json', 'r') as file:
-    analytics_data = json.load(file)
+from techtrackr.usage import UsageCounts, UsageStore
 
-# Extract data from the JSON
-total_pageviews = analytics_data["total_pageviews"]
-total_script_runs = analytics_data["total_script_runs"]
-total_time_seconds = analytics_data["total_time_seconds"]
+st.set_page_config(layout="wide")
 
-per_day_data = analytics_data["per_day"]
-days = per_day_data["days"]
-pageviews = per_day_data["pageviews"]
-script_runs = per_day_data["script_runs"]
 
-widgets_data = analytics_data["widgets"]
+@st.cache_resource
+def load_usage():
+    # Shared by every session; each rerun only reads events newer than the last
+    return UsageCounts(UsageStore())
 
-st.set_page_config(layout="wide")
+
+usage = load_usage().refresh()
 
 # Title and summary
 st.title('Web Analytics Dashboard')
 
+if usage.empty:
+    st.info("No usage has been recorded yet.")
+    st.stop()
+
+# Every chart covers the selected days only
+first_day, last_day = usage.span()
+window = st.sidebar.date_input("Date range", (first_day, last_day), min_value=first_day, max_value=last_day)
+# While picking a range the widget holds only its first day
+start, end = window if len(window) == 2 else (window[0], last_day)
+
+totals = usage.totals(start, end)
+total_pageviews = totals["pageviews"]
+total_script_runs = totals["script_runs"]
+total_time_seconds = totals["seconds"]
+
 # Create three columns for side-by-side display
 col1, col2, col3 = st.columns(3)
 
@@ -55,7 +64,8 @@ col1, col2 = st.columns(2)
 with col1:
     st.subheader('Pageviews and Script Runs per Day')
     
-    df_per_day = pd.DataFrame({'Day': days, 'Pageviews': pageviews, 'Script Runs': script_runs})
+    per_day = usage.per_day(start, end)
+    df_per_day = pd.DataFrame({'Day': per_day.index, 'Pageviews': per_day['pageviews'], 'Script Runs': per_day['script_runs']})
 
     fig_per_day = px.area(df_per_day, x='Day', y=['Pageviews', 'Script Runs'], title='Pageviews and Script Runs per Day')
     st.plotly_chart(fig_per_day)
@@ -64,10 +74,8 @@ with col1:
 with col2:
     st.subheader('Event Type Analysis')
 
-    widget_data = widgets_data["Select Event Type"]
-    event_data = [{'Event Type': event_type, 'Count': count} for event_type, count in widget_data.items() if count > 0]
-
-    df_event = pd.DataFrame(event_data)
+    widget_data = usage.widget_counts("Select Event Type", start, end)
+    df_event = pd.DataFrame({'Event Type': widget_data.index, 'Count': widget_data.values})
 
     fig_event = px.pie(df_event, values='Count', names='Event Type', title='Event Type Analysis')
     st.plotly_chart(fig_event)
@@ -76,13 +84,9 @@ with col2:
 st.subheader('Widget Analysis')
 
 # Handle the space key in "Select Top-Level Category" widget data
-widget_data = widgets_data.get("Select Top-Level Category", {})
-widget_data.pop(" ", None)  # Remove the key with space
-
-# Filter out categories with zero count
-widget_data = {category: count for category, count in widget_data.items() if count > 0}
+widget_data = usage.widget_counts("Select Top-Level Category", start, end).drop(" ", errors="ignore")  # Remove the key with space
 
-df_widget = pd.DataFrame({'Category': widget_data.keys(), 'Count': widget_data.values()})
+df_widget = pd.DataFrame({'Category': widget_data.index, 'Count': widget_data.values})
 
 fig_widget = px.bar(df_widget, x='Category', y='Count', title='Top-Level Categories')
 st.plotly_chart(fig_widget)
@@ -91,13 +95,9 @@ st.plotly_chart(fig_widget)
 st.subheader('First Sub-Level Category Analysis')
 
 # Handle the space key in "Select First Sub-Level Category" widget data
-widget_data = widgets_data.get("Select First Sub-Level Category", {})
-widget_data.pop(" ", None)  # Remove the key with space
+widget_data = usage.widget_counts("Select First Sub-Level Category", start, end).drop(" ", errors="ignore")  # Remove the key with space
 
-# Filter out categories with zero count
-widget_data = {category: count for category, count in widget_data.items() if count > 0}
-
-df_sub_level = pd.DataFrame({'Sub-Level Category': widget_data.keys(), 'Count': widget_data.values()})
+df_sub_level = pd.DataFrame({'Sub-Level Category': widget_data.index, 'Count': widget_data.values})
 
 fig_sub_level = px.bar(df_sub_level, x='Count', y='Sub-Level Category', orientation='h', title='First Sub-Level Categories')
 st.plotly_chart(fig_sub_level)
@@ -106,18 +106,14 @@ st.plotly_chart(fig_sub_level)
 st.subheader('Second Sub-Level Category Analysis')
 
 # Handle the space key in "Select Second Sub-Level Category" widget data
-widget_data = widgets_data.get("Select Second Sub-Level Category", {})
-widget_data.pop(" ", None)  # Remove the key with space
-
-# Filter out categories with zero count
-widget_data = {category: count for category, count in widget_data.items() if count > 0}
+widget_data = usage.widget_counts("Select Second Sub-Level Category", start, end).drop(" ", errors="ignore")  # Remove the key with space
 
-df_sub_level2 = pd.DataFrame({'Sub-Level Category': widget_data.keys(), 'Count': widget_data.values()})
+df_sub_level2 = pd.DataFrame({'Sub-Level Category': widget_data.index, 'Count': widget_data.values})
 
 fig_sub_level2 = px.bar(df_sub_level2, x='Count', y='Sub-Level Category', orientation='h', title='Second Sub-Level Categories')
 st.plotly_chart(fig_sub_level2)
 
 # Start time
-start_time = analytics_data["start_time"]
+start_time = usage.start_time()
 st.subheader('Analytics Start Time')
-st.write(start_time)
+st.write(start_time.strftime('%d %b %Y, %H:%M:%S'))